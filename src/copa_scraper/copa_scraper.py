@@ -1,18 +1,28 @@
 """
 This script will extract the Police Reports from the COPA website 
-by using the requests and BeautifulSoup libraries.
+by using the requests library and BeautifulSoup or lxml (see html_parsers.py).
 
 Author: Federico Dominguez Molina
 """
 
+import argparse
 import os
-import re
-import time
-from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from html_parsers import get_parser
+from manifest import (
+    KEY_COLUMN,
+    MANIFEST_PATH,
+    ScrapeManifest,
+    find_new_or_changed,
+    normalize_column,
+)
+from pdf_downloader import PDFDownloader
+from rate_limiter import TokenBucket, fetch_with_retry
 
 # PARAMETERS
 URL = "https://www.chicagocopa.org/data-cases/case-portal/"
@@ -22,45 +32,87 @@ headers = {
     "User-Agent": "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
 }
 
+CASE_URL = "https://www.chicagocopa.org/case"
 PDF_PATH = "data/pdfs/"
 
+# Politeness settings for the portal
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 2.0
+MAX_RETRIES = 5
+
 
 class COPAScraper:
     PORTAL_URL = URL
     PDF_PATH = PDF_PATH
 
-    def __init__(self):
+    def __init__(
+        self,
+        max_workers=MAX_WORKERS,
+        requests_per_second=REQUESTS_PER_SECOND,
+        max_retries=MAX_RETRIES,
+        parser=None,
+        session=None,
+        portal_url=URL,
+        case_url=CASE_URL,
+        pdf_path=PDF_PATH,
+    ):
+        # The urls and paths can be overridden to run against a local
+        # stand-in of the portal (see replay.py)
+        self.PORTAL_URL = portal_url
+        self.PDF_PATH = pdf_path
+
         # Check if PDF path exists, if not, create it
-        if not os.path.exists(PDF_PATH):
-            os.makedirs(PDF_PATH)
-            print(f"Created {PDF_PATH} directory")
+        if not os.path.exists(self.PDF_PATH):
+            os.makedirs(self.PDF_PATH)
+            print(f"Created {self.PDF_PATH} directory")
         else:
-            print(f"{PDF_PATH} directory already exists")
+            print(f"{self.PDF_PATH} directory already exists")
 
         self.headers = headers
-        self.case_url = "https://www.chicagocopa.org/case"
+        self.case_url = case_url
         self.threshold = 5
         self.pdf_threshold = 10
 
+        # HTML parser backend, lxml when available (see html_parsers.py)
+        self.parser = get_parser(parser)
+
+        # Shared session and rate limiter, used by every worker thread
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(requests_per_second, capacity=max_workers)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self.downloader = PDFDownloader(
+            self.PDF_PATH,
+            headers=self.headers,
+            max_workers=max_workers,
+            rate_limiter=self.rate_limiter,
+            max_retries=max_retries,
+            session=self.session,
+        )
+
         self.get_num_pages()
         print(f"Number of pages: {self.last_page}")
 
+    def fetch(self, url, **kwargs):
+        """GETs the given url through the rate limiter, retrying on 429/5xx"""
+        return fetch_with_retry(
+            self.session,
+            url,
+            headers=self.headers,
+            rate_limiter=self.rate_limiter,
+            max_retries=self.max_retries,
+            **kwargs,
+        )
+
     def get_num_pages(self):
         """Gets the number of pages in the table"""
-        r = requests.get(self.PORTAL_URL, headers=self.headers)
-        soup = BeautifulSoup(r.content, "html.parser")
-        pagination = soup.find("div", {"class": "pagination"})
-
-        # Get text from pagination
-        pagination_text = pagination.text
-        pagination_text = pagination_text.replace("\n", "")
-
-        # Use regex to extract the last page
-        numbers = re.findall(r"\d+", pagination_text)
-        if numbers:
-            self.last_page = int(numbers[-1])
-        else:
-            self.last_page = 1
+        r = self.fetch(self.PORTAL_URL)
+        self.last_page = self.parser.get_last_page(r.content)
 
     @staticmethod
     def is_pdf_available(df):
@@ -77,12 +129,8 @@ class COPAScraper:
 
     def extract_table(self, url):
         """Extracts the table from the given url"""
-        # Use pandas
-        table_index = 0
-        r = requests.get(url, headers=self.headers)
-        soup = BeautifulSoup(r.content, "html.parser")
-        table = soup.find("table")
-        df = pd.read_html(StringIO(str(table)))[table_index]
+        r = self.fetch(url)
+        df = self.parser.parse_table(r.content)
 
         # Construct case URLs
         df.loc[:, "case_url"] = df["Log#"].apply(lambda x: f"{self.case_url}/{x}/")
@@ -92,67 +140,162 @@ class COPAScraper:
 
         return df
 
-    def extract_all_tables(self):
-        """Extracts all tables from the portal"""
-        dfs = []
-        for num_page in range(1, self.last_page + 1):
-            url = f"{self.PORTAL_URL}?sf_paged={num_page}"
-            df = self.extract_table(url)
-            dfs.append(df)
+    def extract_all_tables(self, concurrent=True):
+        """
+        Extracts all tables from the portal. When concurrent is True, pages
+        are fetched by up to max_workers threads; the token bucket keeps the
+        request rate in check. Pages are always concatenated in page order.
+        """
+        urls = [
+            f"{self.PORTAL_URL}?sf_paged={num_page}"
+            for num_page in range(1, self.last_page + 1)
+        ]
 
-            if num_page % self.threshold == 0:
-                print(f"Finished extracting page {num_page}")
-                time.sleep(5)
+        dfs = []
+        if concurrent and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # map yields results in the order of urls, not of completion
+                results = executor.map(self.extract_table, urls)
+                for num_page, df in enumerate(results, 1):
+                    dfs.append(df)
+                    if num_page % self.threshold == 0:
+                        print(f"Finished extracting page {num_page}")
+        else:
+            for num_page, url in enumerate(urls, 1):
+                dfs.append(self.extract_table(url))
+                if num_page % self.threshold == 0:
+                    print(f"Finished extracting page {num_page}")
 
         self.all_tables = pd.concat(dfs, ignore_index=True)
         return self.all_tables
 
-    def extract_all_pdfs(self):
-        """Extracts all PDFs from the portal"""
-        # Get all the urls
-        valid_cases = self.all_tables[self.all_tables["pdf_available"] == "Available"]
+    def extract_all_pdfs(self, cases=None, manifest=None):
+        """
+        Extracts all PDFs from the portal. By default every available case
+        in all_tables is visited; pass `cases` to restrict the run to a
+        subset (e.g. the new or changed cases of an incremental run). When a
+        ScrapeManifest is given, cases it already holds with the same posted
+        date are skipped and every finished case is checkpointed.
+
+        The run has two stages: the case pages are fetched concurrently to
+        find the PDF urls, then the PDFs are streamed to disk by the
+        downloader with a bounded number of parallel downloads.
+        """
+        if cases is None:
+            cases = self.all_tables
+        valid_cases = cases[cases["pdf_available"] == "Available"].copy()
         urls = valid_cases["case_url"].values
-        case_log = valid_cases["Log#"].values
-
-        # Get all the PDF urls
-        pdf_urls = []
-        counter = 1
-        for url, case_log in zip(urls, case_log):
-            try:
-                pdf_url = self.get_pdf_url(url, case_log)
-            except Exception as e:
-                print(f"Error: {e}")
-                pdf_url = "Error"
-            pdf_urls.append(pdf_url)
+        case_logs = valid_cases["Log#"].values
+        posted_dates = dict(zip(case_logs, valid_cases["FSR/Memo Posted Date"].values))
+
+        pdf_urls = {}
+        pending = []
+        for url, case_log in zip(urls, case_logs):
+            if case_log in pdf_urls:
+                continue
+            if manifest is not None and self.is_case_done(
+                manifest, case_log, posted_dates[case_log]
+            ):
+                pdf_urls[case_log] = manifest.get(case_log)["pdf_url"]
+            else:
+                pdf_urls[case_log] = None
+                pending.append((url, case_log))
+
+        if len(pending) < len(pdf_urls):
+            skipped = len(pdf_urls) - len(pending)
+            print(f"Skipped {skipped} cases already in the manifest")
+
+        # Stage 1: find the PDF urls in the case pages
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            found = executor.map(self.safe_find_pdf_url, [url for url, _ in pending])
+            for counter, ((_, case_log), pdf_url) in enumerate(zip(pending, found), 1):
+                pdf_urls[case_log] = pdf_url
+                if pdf_url == "Not Found":
+                    print(f"PDF not found for {case_log}")
+                    if manifest is not None:
+                        manifest.record(case_log, posted_dates[case_log], pdf_url)
+                if counter % self.pdf_threshold == 0:
+                    print(f"Finished extracting PDF url {counter}")
+
+        # Stage 2: stream the PDFs to disk
+        jobs = []
+        for _, case_log in pending:
+            pdf_url = pdf_urls[case_log]
+            if pdf_url.startswith("http"):
+                expected = self.known_sha256(manifest, case_log, pdf_url)
+                jobs.append((pdf_url, case_log, expected))
+
+        counter = 0
+        for case_log, result in self.downloader.download_all(jobs):
+            counter += 1
+            if isinstance(result, Exception):
+                # Errors are not checkpointed so they are retried on the next run
+                print(f"Error: {result}")
+                pdf_urls[case_log] = "Error"
+                continue
+
+            if manifest is not None:
+                manifest.record(
+                    case_log,
+                    posted_dates[case_log],
+                    pdf_urls[case_log],
+                    size=result["size"],
+                    sha256=result["sha256"],
+                )
             if counter % self.pdf_threshold == 0:
                 print(f"Finished extracting PDF {counter}")
-                time.sleep(2.5)
-
-            counter += 1
 
         # Add to dataframe
-        valid_cases.loc[:, "pdf_url"] = pdf_urls
+        valid_cases.loc[:, "pdf_url"] = [pdf_urls[case_log] for case_log in case_logs]
 
         return valid_cases
 
+    def is_case_done(self, manifest, case_log, posted_date):
+        """A case is done if the manifest has it and its PDF is on disk"""
+        if not manifest.is_done(case_log, posted_date):
+            return False
+
+        pdf_url = manifest.get(case_log)["pdf_url"]
+        if not str(pdf_url).startswith("http"):
+            return True
+        return os.path.exists(self.downloader.get_file_path(case_log))
+
+    @staticmethod
+    def known_sha256(manifest, case_log, pdf_url):
+        """
+        Returns the checksum recorded for a PDF, but only if it was
+        downloaded from the same url, otherwise it says nothing about
+        the remote file
+        """
+        if manifest is None:
+            return None
+        entry = manifest.get(case_log)
+        if entry is None or entry["pdf_url"] != pdf_url:
+            return None
+        return entry.get("sha256")
+
+    def find_pdf_url(self, url):
+        """Finds the url of the Final Summary Report in a case page"""
+        r = self.fetch(url)
+        return self.parser.find_pdf_url(r.content)
+
+    def safe_find_pdf_url(self, url):
+        """Same as find_pdf_url, but returns "Error" instead of raising"""
+        try:
+            return self.find_pdf_url(url)
+        except Exception as e:
+            print(f"Error: {e}")
+            return "Error"
+
     def get_pdf_url(self, url, case_log):
         """
         Extract the pdf given the url
         """
-        r = requests.get(url, headers=self.headers)
-        soup = BeautifulSoup(r.content, "html.parser")
-
-        # Search for element with text 'Final Summary Report'
-        pdf_url = "Not Found"
-        for a in soup.find_all("a", href=True):
-            if "Final Summary Report" in a.text:
-                pdf_url = a["href"]
+        pdf_url = self.find_pdf_url(url)
 
         # If found, download the pdf
-        if pdf_url is not None:
-            r = requests.get(pdf_url, stream=True, headers=self.headers)
-            with open(f"{self.PDF_PATH}/{case_log}.pdf", "wb") as f:
-                f.write(r.content)
+        if pdf_url != "Not Found":
+            self.downloader.download(pdf_url, case_log)
 
         else:
             print(f"PDF not found for {case_log}")
@@ -160,14 +303,58 @@ class COPAScraper:
         return pdf_url
 
 
+def run_incremental(scraper, manifest_path=MANIFEST_PATH):
+    """
+    Scrapes the portal tables, diffs them against data/copa_data.csv and only
+    visits the new or changed cases. Both .csv files are written at the end,
+    so a crashed run is resumed from the manifest on the next invocation.
+    """
+    stored_tables = None
+    if os.path.exists("data/copa_data.csv"):
+        stored_tables = pd.read_csv("data/copa_data.csv", dtype={KEY_COLUMN: str})
+
+    fresh_tables = scraper.extract_all_tables()
+    changed_cases = find_new_or_changed(fresh_tables, stored_tables)
+    print(f"Found {len(changed_cases)} new or changed cases")
+
+    with ScrapeManifest(manifest_path) as manifest:
+        new_cases = scraper.extract_all_pdfs(cases=changed_cases, manifest=manifest)
+
+    # Keep the previously stored rows of the cases that did not change
+    if os.path.exists("data/copa_data_with_pdf.csv"):
+        stored_cases = pd.read_csv(
+            "data/copa_data_with_pdf.csv", dtype={KEY_COLUMN: str}
+        )
+        changed_logs = set(normalize_column(changed_cases[KEY_COLUMN]))
+        unchanged = ~normalize_column(stored_cases[KEY_COLUMN]).isin(changed_logs)
+        new_cases = pd.concat([stored_cases[unchanged], new_cases], ignore_index=True)
+
+    fresh_tables.to_csv("data/copa_data.csv", index=False)
+    new_cases.to_csv("data/copa_data_with_pdf.csv", index=False)
+
+    return new_cases
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape COPA's Case Portal")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only fetch cases that are new or changed since the last run",
+    )
+    args = parser.parse_args()
+
     scraper = COPAScraper()
 
-    if os.path.exists("data/copa_data.csv"):
-        scraper.all_tables = pd.read_csv("data/copa_data.csv")
+    if args.incremental:
+        run_incremental(scraper)
+
     else:
-        tables = scraper.extract_all_tables()
-        tables.to_csv("copa_data.csv", index=False)
+        if os.path.exists("data/copa_data.csv"):
+            scraper.all_tables = pd.read_csv("data/copa_data.csv")
+        else:
+            tables = scraper.extract_all_tables()
+            tables.to_csv("data/copa_data.csv", index=False)
 
-    valid_cases = scraper.extract_all_pdfs()
-    valid_cases.to_csv("data/copa_data_with_pdf.csv", index=False)
+        valid_cases = scraper.extract_all_pdfs()
+        valid_cases.to_csv("data/copa_data_with_pdf.csv", index=False)
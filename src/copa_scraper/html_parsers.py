@@ -0,0 +1,135 @@
+"""
+This script contains the HTML parser backends used by the scraper. Every
+backend extracts the three things we need from the COPA pages: the number
+of pages of the portal, the case table of a portal page and the url of the
+Final Summary Report in a case page.
+
+The "html.parser" backend is the original BeautifulSoup + pd.read_html
+code path. The "lxml" backend parses each page once with lxml (in C), finds
+the pagination, the table and the FSR link with XPath and only hands the
+<table> element to pd.read_html, so the DataFrame is built by pandas
+exactly as before.
+"""
+
+import re
+from io import StringIO
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+FSR_LINK_TEXT = "Final Summary Report"
+
+
+def get_last_page_number(pagination_text):
+    """Returns the last number shown in the pagination, 1 if there is none"""
+    pagination_text = pagination_text.replace("\n", "")
+
+    # Use regex to extract the last page
+    numbers = re.findall(r"\d+", pagination_text)
+    if numbers:
+        return int(numbers[-1])
+    else:
+        return 1
+
+
+class BeautifulSoupParser:
+    """Original backend: BeautifulSoup's html.parser plus pd.read_html"""
+
+    name = "html.parser"
+
+    def get_last_page(self, content):
+        """Gets the number of pages in the table"""
+        soup = BeautifulSoup(content, "html.parser")
+        pagination = soup.find("div", {"class": "pagination"})
+
+        return get_last_page_number(pagination.text)
+
+    def parse_table(self, content):
+        """Extracts the first table of the page as a DataFrame"""
+        table_index = 0
+        soup = BeautifulSoup(content, "html.parser")
+        table = soup.find("table")
+
+        return pd.read_html(StringIO(str(table)))[table_index]
+
+    def find_pdf_url(self, content):
+        """Finds the url of the Final Summary Report in a case page"""
+        soup = BeautifulSoup(content, "html.parser")
+
+        # Search for element with text 'Final Summary Report'
+        pdf_url = "Not Found"
+        for a in soup.find_all("a", href=True):
+            if FSR_LINK_TEXT in a.text:
+                pdf_url = a["href"]
+
+        return pdf_url
+
+
+class LxmlParser:
+    """
+    Single pass backend built on lxml. Only the first <table> is passed on
+    to pd.read_html, so the column names and dtypes match the original
+    backend.
+    """
+
+    name = "lxml"
+
+    def __init__(self):
+        if not LXML_AVAILABLE:
+            raise ImportError("The lxml parser backend requires lxml")
+
+    def get_last_page(self, content):
+        """Gets the number of pages in the table"""
+        document = lxml.html.fromstring(content)
+        pagination = document.xpath(
+            '//div[contains(concat(" ", normalize-space(@class), " "), " pagination ")]'
+        )
+
+        return get_last_page_number(pagination[0].text_content())
+
+    def parse_table(self, content):
+        """Extracts the first table of the page as a DataFrame"""
+        document = lxml.html.fromstring(content)
+        table = document.xpath("//table")[0]
+
+        # The table is a small part of the page, serializing it from the
+        # lxml tree is cheap compared to parsing the page with html.parser
+        html = lxml.html.tostring(table, encoding="unicode")
+        return pd.read_html(StringIO(html), flavor="lxml")[0]
+
+    def find_pdf_url(self, content):
+        """Finds the url of the Final Summary Report in a case page"""
+        document = lxml.html.fromstring(content)
+        links = document.xpath(f'//a[@href][contains(., "{FSR_LINK_TEXT}")]/@href')
+
+        # The original loop kept the last matching link
+        if links:
+            return str(links[-1])
+        return "Not Found"
+
+
+PARSERS = {
+    BeautifulSoupParser.name: BeautifulSoupParser,
+    LxmlParser.name: LxmlParser,
+}
+
+
+def get_parser(name=None):
+    """
+    Returns a parser backend by name. Defaults to lxml when it is
+    installed, otherwise to BeautifulSoup's html.parser
+    """
+    if name is None:
+        name = LxmlParser.name if LXML_AVAILABLE else BeautifulSoupParser.name
+
+    if name not in PARSERS:
+        raise ValueError(f"Unknown parser {name}, choose one of {list(PARSERS)}")
+
+    return PARSERS[name]()
@@ -0,0 +1,145 @@
+"""
+This script contains the pieces needed to scrape the portal incrementally:
+a diff between a freshly scraped table and the stored copa_data.csv, and a
+checkpoint manifest so an interrupted PDF run resumes where it stopped.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+MANIFEST_PATH = "data/scrape_manifest.json"
+KEY_COLUMN = "Log#"
+DATE_COLUMN = "FSR/Memo Posted Date"
+
+
+def normalize_column(series):
+    """Casts a column to stripped strings so NaN and '' compare equal"""
+    return series.fillna("").astype(str).str.strip()
+
+
+def find_new_or_changed(fresh, stored):
+    """
+    Returns the rows of the fresh table that are not in the stored table,
+    or whose FSR/Memo Posted Date changed since it was stored
+    """
+    if stored is None or stored.empty:
+        return fresh.copy()
+
+    # The portal lists some Log# more than once, so compare (Log#, date) pairs
+    stored_pairs = set(
+        zip(normalize_column(stored[KEY_COLUMN]), normalize_column(stored[DATE_COLUMN]))
+    )
+    fresh_pairs = zip(
+        normalize_column(fresh[KEY_COLUMN]), normalize_column(fresh[DATE_COLUMN])
+    )
+
+    changed = [pair not in stored_pairs for pair in fresh_pairs]
+
+    return fresh.loc[changed].copy()
+
+
+class ScrapeManifest:
+    """
+    Checkpoint of the cases whose case page and PDF were already processed.
+    Every case is appended to a JSON-lines log next to the manifest as soon
+    as it is done, so a crash only loses the case that was in flight. The
+    log is folded into the manifest by close() (or when a crashed run's log
+    is found on load), so the whole manifest is only rewritten once per
+    run instead of once per case.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.cases = {}
+        self._log = None
+
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.cases = json.load(f)
+            print(f"Loaded {len(self.cases)} cases from {self.path}")
+
+        if os.path.exists(self.log_path):
+            replayed = self._replay_log()
+            print(f"Recovered {replayed} cases from {self.log_path}")
+            self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_done(self, case_log, posted_date):
+        """A case is done if it was processed with the same posted date"""
+        entry = self.cases.get(str(case_log))
+        if entry is None:
+            return False
+        return entry["posted_date"] == self._normalize_date(posted_date)
+
+    def get(self, case_log):
+        return self.cases.get(str(case_log))
+
+    def record(self, case_log, posted_date, pdf_url, **extra):
+        """Marks a case as done and appends it to the log"""
+        entry = {
+            "posted_date": self._normalize_date(posted_date),
+            "pdf_url": pdf_url,
+            **extra,
+        }
+        self.cases[str(case_log)] = entry
+
+        if self._log is None:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+        self._log.write(json.dumps([str(case_log), entry]) + "\n")
+        self._log.flush()
+
+    def _replay_log(self):
+        """Applies the cases of the log to the manifest, returns how many"""
+        replayed = 0
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    case_log, entry = json.loads(line)
+                except ValueError:
+                    # Last line cut short by the crash
+                    break
+                self.cases[case_log] = entry
+                replayed += 1
+        return replayed
+
+    def close(self):
+        """Writes the manifest with every recorded case and removes the log"""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if os.path.exists(self.log_path):
+            self.save()
+
+    def save(self):
+        """
+        Writes the manifest atomically, never leaving a half written file,
+        then removes the log it now contains
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.cases, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+        if self._log is None and os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    @staticmethod
+    def _normalize_date(posted_date):
+        if pd.isna(posted_date):
+            return ""
+        return str(posted_date).strip()
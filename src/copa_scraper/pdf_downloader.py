@@ -0,0 +1,159 @@
+"""
+This script contains the download stage of the scraper. PDFs are streamed
+in fixed-size chunks to a temporary file next to their destination, hashed
+on the fly and atomically renamed into place, so memory stays flat and a
+crash never leaves a truncated report in data/pdfs/.
+"""
+
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import fetch_with_retry
+
+CHUNK_SIZE = 64 * 1024
+
+
+def sha256_file(file_path):
+    """Computes the SHA-256 of a file without loading it in memory"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PDFDownloader:
+    """
+    Downloads PDFs over a pooled keep-alive session with up to max_workers
+    downloads in flight. Existing files are skipped when their checksum
+    matches a known one, or when their size matches the Content-Length
+    reported by the server.
+    """
+
+    CHUNK_SIZE = CHUNK_SIZE
+
+    def __init__(
+        self,
+        pdf_path,
+        headers=None,
+        max_workers=4,
+        rate_limiter=None,
+        max_retries=5,
+        session=None,
+    ):
+        self.pdf_path = pdf_path
+        self.headers = headers
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+
+    def get_file_path(self, case_log):
+        return os.path.join(self.pdf_path, f"{case_log}.pdf")
+
+    def get_remote_size(self, pdf_url):
+        """Returns the Content-Length of the PDF, or None if unknown"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        try:
+            r = self.session.head(
+                pdf_url, headers=self.headers, allow_redirects=True, timeout=30
+            )
+        except requests.RequestException:
+            return None
+
+        if not r.ok or "Content-Length" not in r.headers:
+            return None
+        return int(r.headers["Content-Length"])
+
+    def is_up_to_date(self, file_path, pdf_url, expected_sha256=None):
+        """Checks whether the local copy of a PDF can be kept as it is"""
+        if not os.path.exists(file_path):
+            return False
+
+        if expected_sha256 is not None:
+            return sha256_file(file_path) == expected_sha256
+
+        remote_size = self.get_remote_size(pdf_url)
+        return remote_size is not None and remote_size == os.path.getsize(file_path)
+
+    def download(self, pdf_url, case_log, expected_sha256=None):
+        """
+        Downloads a single PDF and returns a dict with its status
+        ("downloaded" or "skipped"), size and sha256
+        """
+        file_path = self.get_file_path(case_log)
+
+        if self.is_up_to_date(file_path, pdf_url, expected_sha256):
+            return {
+                "status": "skipped",
+                "size": os.path.getsize(file_path),
+                "sha256": expected_sha256 or sha256_file(file_path),
+            }
+
+        r = fetch_with_retry(
+            self.session,
+            pdf_url,
+            headers=self.headers,
+            rate_limiter=self.rate_limiter,
+            max_retries=self.max_retries,
+            stream=True,
+        )
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.pdf_path, prefix=f".{case_log}.", suffix=".part"
+        )
+        try:
+            with r, os.fdopen(fd, "wb") as f:
+                for chunk in r.iter_content(chunk_size=self.CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+
+            # Only trust Content-Length when the body was not re-encoded
+            expected_size = r.headers.get("Content-Length")
+            if expected_size and "Content-Encoding" not in r.headers:
+                if int(expected_size) != size:
+                    raise IOError(
+                        f"Incomplete download for {case_log}: "
+                        f"got {size} of {expected_size} bytes"
+                    )
+
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {"status": "downloaded", "size": size, "sha256": digest.hexdigest()}
+
+    def download_all(self, jobs):
+        """
+        Downloads every (pdf_url, case_log, expected_sha256) job with a
+        bounded number of downloads in parallel. Yields (case_log, result)
+        as downloads complete; failed downloads yield the exception instead.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.download, pdf_url, case_log, expected): case_log
+                for pdf_url, case_log, expected in jobs
+            }
+            for future in as_completed(futures):
+                case_log = futures[future]
+                try:
+                    yield case_log, future.result()
+                except Exception as e:
+                    yield case_log, e
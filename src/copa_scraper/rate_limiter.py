@@ -0,0 +1,113 @@
+"""
+This script contains the helpers used by the scraper to be polite to the
+COPA website: a thread-safe token bucket that spaces out requests and a
+fetch function that retries with exponential backoff on 429/5xx responses.
+"""
+
+import random
+import threading
+import time
+
+import requests
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Every request takes one token; tokens are
+    refilled at `rate` per second up to `capacity`, so short bursts are
+    allowed but the long run average never exceeds `rate`.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self):
+        """Consumes a token if one is available, without blocking"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """Blocks until a token is available and consumes it"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def get_retry_after(response):
+    """Returns the seconds requested by a Retry-After header, if any"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        return None
+
+
+def fetch_with_retry(
+    session,
+    url,
+    headers=None,
+    rate_limiter=None,
+    max_retries=5,
+    backoff_factor=1.0,
+    timeout=30,
+    **kwargs,
+):
+    """
+    GETs the given url, retrying on 429/5xx responses and connection errors.
+    The wait between attempts doubles every time (with some jitter) unless
+    the server asks for a specific delay through Retry-After.
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+
+        try:
+            r = session.get(url, headers=headers, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            wait = backoff_factor * 2**attempt
+            print(f"Error fetching {url}: {e}. Retrying in {wait:.1f}s")
+        else:
+            if r.status_code not in RETRY_STATUS_CODES:
+                r.raise_for_status()
+                return r
+
+            if attempt == max_retries:
+                r.raise_for_status()
+
+            wait = get_retry_after(r)
+            if wait is None:
+                wait = backoff_factor * 2**attempt
+            print(f"Got {r.status_code} from {url}. Retrying in {wait:.1f}s")
+            r.close()
+
+        time.sleep(wait + random.uniform(0, backoff_factor / 2))
@@ -0,0 +1,375 @@
+"""
+This script contains an offline record/replay harness for the scraper.
+
+1. `record` runs the real scraper against chicagocopa.org once and saves
+   every portal page, case page and PDF it fetches into a fixture store.
+2. `ReplayServer` serves the fixture store from a local HTTP server, with
+   configurable latency, random 5xx errors and 429 rate limiting.
+3. `benchmark` points a COPAScraper at the local server and measures the
+   throughput and retries of get_num_pages, extract_all_tables and
+   extract_all_pdfs, fully offline.
+
+Usage:
+
+    python replay.py record --store data/fixtures --pages 3 --cases 30
+    python replay.py benchmark --store data/fixtures --latency 0.05 \\
+        --error-rate 0.05 --server-rate-limit 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from copa_scraper import CASE_URL, URL, COPAScraper
+from rate_limiter import TokenBucket
+
+STORE_PATH = "data/fixtures/"
+
+
+def get_key(url):
+    """Fixtures are keyed by path and query, the host is not relevant"""
+    parts = urlsplit(url)
+    if parts.query:
+        return f"{parts.path}?{parts.query}"
+    return parts.path
+
+
+def get_origin(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class FixtureStore:
+    """
+    Directory with one file per recorded response plus an index.json that
+    maps each url key to its file, status and content type
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.index_path = os.path.join(self.path, "index.json")
+        self.lock = threading.Lock()
+        self.index = {"origins": [], "portal_pages": 0, "responses": {}}
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def __contains__(self, key):
+        return key in self.index["responses"]
+
+    def __len__(self):
+        return len(self.index["responses"])
+
+    def save(self, url, status, content_type, content):
+        """Stores a response body under the key of its url"""
+        key = get_key(url)
+        file_name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, file_name), "wb") as f:
+            f.write(content)
+
+        with self.lock:
+            origin = get_origin(url)
+            if origin not in self.index["origins"]:
+                self.index["origins"].append(origin)
+            self.index["responses"][key] = {
+                "file": file_name,
+                "status": status,
+                "content_type": content_type,
+            }
+
+    def load(self, key):
+        """Returns (status, content_type, body) for a key"""
+        entry = self.index["responses"][key]
+        with open(os.path.join(self.path, entry["file"]), "rb") as f:
+            content = f.read()
+        return entry["status"], entry["content_type"], content
+
+    def write_index(self):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, indent=1)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that saves every GET response into a FixtureStore"""
+
+    def __init__(self, store, **kwargs):
+        self.store = store
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if request.method == "GET" and response.status_code == 200:
+            # Reading the body here is fine, requests serves iter_content
+            # from the cached body afterwards
+            self.store.save(
+                request.url,
+                response.status_code,
+                response.headers.get("Content-Type", ""),
+                response.content,
+            )
+        return response
+
+
+def record(store, pages=None, cases=None, **scraper_kwargs):
+    """
+    Runs the scraper against the real portal, saving everything it fetches.
+    `pages` and `cases` limit the size of the recording.
+    """
+    max_workers = scraper_kwargs.get("max_workers", 4)
+    session = requests.Session()
+    adapter = RecordingAdapter(store, pool_connections=1, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    pdf_path = tempfile.mkdtemp(prefix="copa_record_")
+    try:
+        scraper = COPAScraper(session=session, pdf_path=pdf_path, **scraper_kwargs)
+        if pages is not None:
+            scraper.last_page = min(scraper.last_page, pages)
+
+        tables = scraper.extract_all_tables()
+        if cases is not None:
+            available = tables[tables["pdf_available"] == "Available"]
+            tables = available.head(cases)
+        scraper.extract_all_pdfs(cases=tables)
+    finally:
+        shutil.rmtree(pdf_path)
+
+    store.index["portal_pages"] = scraper.last_page
+    store.write_index()
+    print(f"Recorded {len(store)} responses into {store.path}")
+
+
+class ReplayServer:
+    """
+    Local stand-in for the portal. Serves the fixture store with an optional
+    fixed latency, a random error rate (503s) and a server side rate limit
+    (429s with Retry-After). Absolute links to the recorded origins are
+    rewritten to point to the server.
+    """
+
+    def __init__(
+        self,
+        store,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        error_rate=0.0,
+        rate_limit=None,
+        retry_after=1,
+        seed=None,
+    ):
+        self.store = store
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.bucket = None
+        if rate_limit is not None:
+            self.bucket = TokenBucket(rate_limit, capacity=max(1, int(rate_limit)))
+
+        self.stats = {
+            "requests": 0,
+            "ok": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "missing": 0,
+        }
+        self.stats_lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, stat):
+        with self.stats_lock:
+            self.stats[stat] += 1
+
+    def rewrite(self, content):
+        """Points the recorded absolute links to the local server"""
+        for origin in self.store.index["origins"]:
+            content = content.replace(origin.encode(), self.base_url.encode())
+        return content
+
+    def respond(self, key):
+        """Decides what to answer to a request: (status, headers, body)"""
+        self.count("requests")
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.bucket is not None and not self.bucket.try_acquire():
+            self.count("rate_limited")
+            return 429, {"Retry-After": str(self.retry_after)}, b""
+
+        with self.stats_lock:
+            failed = self.random.random() < self.error_rate
+        if failed:
+            self.count("errors")
+            return 503, {}, b""
+
+        if key not in self.store:
+            self.count("missing")
+            return 404, {}, b""
+
+        status, content_type, content = self.store.load(key)
+        if content_type.startswith("text/html"):
+            content = self.rewrite(content)
+        self.count("ok")
+        return status, {"Content-Type": content_type}, content
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, send_body):
+                status, headers, content = server.respond(get_key(self.path))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(content)
+
+            def do_GET(self):
+                self._reply(send_body=True)
+
+            def do_HEAD(self):
+                self._reply(send_body=False)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def benchmark(store, server_kwargs=None, **scraper_kwargs):
+    """
+    Runs the scraper against a ReplayServer and returns the timings of each
+    stage together with the server side counters
+    """
+    results = {}
+    with ReplayServer(store, **(server_kwargs or {})) as server:
+        portal_url = URL.replace(get_origin(URL), server.base_url)
+        case_url = CASE_URL.replace(get_origin(CASE_URL), server.base_url)
+        pdf_path = tempfile.mkdtemp(prefix="copa_benchmark_")
+
+        try:
+            start = time.perf_counter()
+            scraper = COPAScraper(
+                portal_url=portal_url,
+                case_url=case_url,
+                pdf_path=pdf_path,
+                **scraper_kwargs,
+            )
+            results["get_num_pages"] = {"seconds": time.perf_counter() - start}
+
+            # Only the recorded pages can be replayed
+            scraper.last_page = min(scraper.last_page, store.index["portal_pages"])
+
+            start = time.perf_counter()
+            tables = scraper.extract_all_tables()
+            elapsed = time.perf_counter() - start
+            results["extract_all_tables"] = {
+                "seconds": elapsed,
+                "pages_per_second": scraper.last_page / elapsed,
+            }
+
+            # Only the recorded case pages can be replayed
+            recorded = tables["case_url"].map(lambda url: get_key(url) in store)
+            start = time.perf_counter()
+            cases = scraper.extract_all_pdfs(cases=tables[recorded])
+            elapsed = time.perf_counter() - start
+            downloaded = sum(
+                os.path.getsize(os.path.join(pdf_path, f)) for f in os.listdir(pdf_path)
+            )
+            results["extract_all_pdfs"] = {
+                "seconds": elapsed,
+                "cases_per_second": len(cases) / elapsed,
+                "megabytes_per_second": downloaded / 1e6 / elapsed,
+                "errors": int((cases["pdf_url"] == "Error").sum()),
+            }
+        finally:
+            shutil.rmtree(pdf_path)
+
+        results["server"] = dict(server.stats)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record/replay the COPA portal")
+    parser.add_argument("command", choices=["record", "serve", "benchmark"])
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--pages", type=int, help="portal pages to record")
+    parser.add_argument("--cases", type=int, help="cases to record")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--server-rate-limit", type=float, default=None)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rps", type=float, default=2.0, help="client rate limit")
+    parser.add_argument("--retries", type=int, default=5)
+    args = parser.parse_args()
+
+    store = FixtureStore(args.store)
+    server_kwargs = {
+        "port": args.port,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit": args.server_rate_limit,
+    }
+    scraper_kwargs = {
+        "max_workers": args.workers,
+        "requests_per_second": args.rps,
+        "max_retries": args.retries,
+    }
+
+    if args.command == "record":
+        record(store, pages=args.pages, cases=args.cases, **scraper_kwargs)
+
+    elif args.command == "serve":
+        server = ReplayServer(store, **server_kwargs)
+        print(f"Serving {len(store)} responses at {server.base_url}")
+        server.start()
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+
+    else:
+        results = benchmark(store, server_kwargs, **scraper_kwargs)
+        print(json.dumps(results, indent=2))
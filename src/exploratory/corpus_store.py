@@ -0,0 +1,192 @@
+"""
+This script contains a compact store for the whole corpus of reports.
+Instead of thousands of small .txt files, the raw text, the cleaned text
+and the page offsets of every report live in a single blob file plus a
+JSON index keyed by Log#. The blob is memory-mapped, so reading a report
+is a slice of the mapping, and the store can be iterated in batches.
+
+Build it from the extracted .txt files with:
+
+    python corpus_store.py ../../data/pdfs/text_files ../../data/corpus \\
+        --offsets ../../data/pdfs/page_offsets
+"""
+
+import argparse
+import json
+import mmap
+import os
+import zlib
+
+FIELDS = ["raw", "clean"]
+
+
+class CorpusStore:
+    """
+    Read-only access to a corpus built with CorpusStore.build. The files
+    are <path>.blob and <path>.index.json
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(f"{path}.index.json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.compressed = index["compressed"]
+        # Fingerprint of the cleaning that produced the "clean" texts, None
+        # for stores built before it was recorded
+        self.clean_fingerprint = index.get("clean_fingerprint")
+        self.documents = index["documents"]
+        self.log_numbers = index["order"]
+
+        self.blob_file = open(f"{path}.blob", "rb")
+        if os.fstat(self.blob_file.fileno()).st_size:
+            self.blob = mmap.mmap(self.blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.blob = b""
+
+    def __getstate__(self):
+        # Reopened from its path, e.g. in the get_full_corpus workers
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __contains__(self, log_number):
+        return log_number in self.documents
+
+    def __len__(self):
+        return len(self.log_numbers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self.blob_file.close()
+
+    def get(self, log_number, field="raw"):
+        """Returns the raw or cleaned text of a report"""
+        start, length = self.documents[log_number][field]
+        data = self.blob[start : start + length]
+        if self.compressed:
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+    def get_page_offsets(self, log_number):
+        """Returns the [start, end) range of every page in the raw text"""
+        return self.documents[log_number]["pages"]
+
+    def get_page(self, log_number, page_number):
+        """Returns the raw text of a single page of a report"""
+        start, end = self.get_page_offsets(log_number)[page_number]
+        return self.get(log_number, "raw")[start:end]
+
+    def iter_batches(self, batch_size=256, field="raw", log_numbers=None):
+        """
+        Yields lists of (log_number, text) in Log# order, for the given
+        Log#s (every report by default)
+        """
+        if log_numbers is None:
+            log_numbers = self.log_numbers
+        batch = []
+        for log_number in log_numbers:
+            batch.append((log_number, self.get(log_number, field)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @classmethod
+    def build(
+        cls,
+        path,
+        text_folder,
+        offsets_folder=None,
+        clean_fn=None,
+        compress=False,
+        clean_fingerprint=None,
+    ):
+        """
+        Writes the store from a folder of <Log#>.txt files. clean_fn maps a
+        raw text to its cleaned version (e.g. TextParser.clean_text), and
+        clean_fingerprint identifies that cleaning (e.g.
+        TextParser.clean_fingerprint) so readers that clean differently
+        don't use it; the page offsets are read from
+        <offsets_folder>/<Log#>.json if present.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        filenames = sorted(f for f in os.listdir(text_folder) if f.endswith(".txt"))
+        documents = {}
+        position = 0
+
+        with open(f"{path}.blob.tmp", "wb") as blob:
+            for filename in filenames:
+                log_number = filename[: -len(".txt")]
+                with open(os.path.join(text_folder, filename), "r", encoding="utf-8") as f:
+                    raw = f.read()
+
+                texts = {"raw": raw}
+                if clean_fn is not None:
+                    texts["clean"] = clean_fn(raw)
+
+                document = {}
+                for field, text in texts.items():
+                    data = text.encode("utf-8")
+                    if compress:
+                        data = zlib.compress(data)
+                    blob.write(data)
+                    document[field] = [position, len(data)]
+                    position += len(data)
+
+                document["pages"] = [[0, len(raw)]]
+                if offsets_folder is not None:
+                    offsets_file = os.path.join(offsets_folder, f"{log_number}.json")
+                    if os.path.exists(offsets_file):
+                        with open(offsets_file, "r") as f:
+                            document["pages"] = json.load(f)
+
+                documents[log_number] = document
+
+        index = {
+            "compressed": compress,
+            "clean_fingerprint": clean_fingerprint if clean_fn is not None else None,
+            "order": sorted(documents),
+            "documents": documents,
+        }
+        with open(f"{path}.index.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+
+        os.replace(f"{path}.blob.tmp", f"{path}.blob")
+        os.replace(f"{path}.index.json.tmp", f"{path}.index.json")
+        print(f"Stored {len(documents)} reports in {path}.blob")
+
+        return cls(path)
+
+
+if __name__ == "__main__":
+    from text_parser import TextParser
+
+    parser = argparse.ArgumentParser(description="Build the corpus store")
+    parser.add_argument("text_folder", help="folder with the <Log#>.txt files")
+    parser.add_argument("path", help="output path, without extension")
+    parser.add_argument("--offsets", help="folder with the page offsets")
+    parser.add_argument("--compress", action="store_true")
+    args = parser.parse_args()
+
+    text_parser = TextParser(args.text_folder, nlp_task="summarization")
+    CorpusStore.build(
+        args.path,
+        args.text_folder,
+        offsets_folder=args.offsets,
+        clean_fn=text_parser.clean_text,
+        compress=args.compress,
+        clean_fingerprint=text_parser.clean_fingerprint,
+    ).close()
@@ -0,0 +1,221 @@
+"""
+This script finds near-duplicate reports (the same FSR posted under
+different Log#s, amended reports posted again...) without comparing every
+pair of reports:
+
+1. Every report becomes a set of word shingles (k consecutive tokens from
+   TextParser.process_file), hashed with CRC32.
+2. A MinHash signature of num_perm values summarizes each set; the share
+   of equal values between two signatures estimates their Jaccard
+   similarity.
+3. Signatures are cut in bands and hashed into buckets (LSH): only reports
+   that share a bucket are compared, each one with the first report of the
+   bucket, so the work grows linearly with the number of reports. Buckets
+   larger than max_bucket_size (boilerplate shared by thousands of
+   reports) are skipped.
+
+Candidates above the similarity threshold are grouped into clusters. In
+every cluster the longest report is kept and the others are written to a
+skip list (Log#, duplicate_of, similarity) that TextParser(skip_list=...)
+uses to leave them out of the corpus.
+
+    python dedup.py ../../data/pdfs/text_files --output ../../data/duplicates.csv
+"""
+
+import argparse
+import csv
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+# A prime above 2**32, the shingle hashes are 32-bit
+PRIME = np.uint64(4294967311)
+
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 similarity very likely share a bucket
+BANDS = 16
+SHINGLE_SIZE = 5
+THRESHOLD = 0.8
+# Reports sharing a bucket above this size are not compared through it
+MAX_BUCKET_SIZE = 1000
+
+
+def shingle_hashes(tokens, shingle_size=SHINGLE_SIZE):
+    """Returns the unique CRC32 hashes of the k-token shingles of a document"""
+    if len(tokens) < shingle_size:
+        shingles = [" ".join(tokens)] if tokens else []
+    else:
+        shingles = [
+            " ".join(tokens[i : i + shingle_size])
+            for i in range(len(tokens) - shingle_size + 1)
+        ]
+    return np.unique(
+        np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+    )
+
+
+class MinHashLSH:
+    """
+    Computes MinHash signatures with num_perm hash functions
+    (a * x + b) mod PRIME and buckets them in bands of num_perm / bands rows
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = np.random.RandomState(seed)
+        # a < 2**31 keeps a * x + b below 2**64
+        self.a = rng.randint(1, 2**31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 2**31, size=num_perm).astype(np.uint64)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        self.keys = []
+        self.signatures = []
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+
+    def signature(self, hashes):
+        # One row per hash function, one column per shingle
+        values = (np.outer(self.a, hashes) + self.b[:, None]) % PRIME
+        return values.min(axis=1)
+
+    def add(self, key, hashes):
+        """Adds a document; documents without shingles are ignored"""
+        if len(hashes) == 0:
+            return
+        signature = self.signature(hashes)
+        index = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(signature)
+        for band in range(self.bands):
+            rows = signature[band * self.rows : (band + 1) * self.rows]
+            self.buckets[band][rows.tobytes()].append(index)
+
+    def candidate_buckets(self, max_size=MAX_BUCKET_SIZE):
+        """
+        Yields the lists of documents that share a bucket, skipping the
+        buckets with a single document or more than max_size (None for no
+        limit)
+        """
+        for buckets in self.buckets:
+            for indices in buckets.values():
+                if len(indices) > 1 and (max_size is None or len(indices) <= max_size):
+                    yield indices
+
+    def similarity(self, i, j):
+        """Estimated Jaccard similarity of two documents"""
+        return float(np.mean(self.signatures[i] == self.signatures[j]))
+
+
+def find_duplicates(
+    parser,
+    threshold=THRESHOLD,
+    shingle_size=SHINGLE_SIZE,
+    num_perm=NUM_PERM,
+    bands=BANDS,
+    max_bucket_size=MAX_BUCKET_SIZE,
+    print_progress=False,
+):
+    """
+    Returns the near-duplicate clusters of the parser's corpus, as a list
+    of {"keep": Log#, "duplicates": [(Log#, similarity), ...]}
+    """
+    lsh = MinHashLSH(num_perm, bands)
+    lengths = {}
+    # Stop words are kept, they matter to tell two texts apart
+    documents = parser.iter_corpus(remove_stops=False, stem_input=False)
+    for i, (log_number, tokens) in enumerate(documents):
+        if print_progress and i % 1000 == 0:
+            print(f"Hashing report {i}...")
+        lengths[log_number] = len(tokens)
+        lsh.add(log_number, shingle_hashes(tokens, shingle_size))
+
+    # Union-find of the reports above the threshold. Every member of a
+    # bucket is compared with its first member only, never pair by pair.
+    parents = list(range(len(lsh.keys)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for indices in lsh.candidate_buckets(max_bucket_size):
+        first = indices[0]
+        for i in indices[1:]:
+            # Already linked through another band
+            if find(i) == find(first):
+                continue
+            if lsh.similarity(first, i) >= threshold:
+                parents[find(i)] = find(first)
+
+    groups = defaultdict(list)
+    for i in range(len(lsh.keys)):
+        groups[find(i)].append(i)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) == 1:
+            continue
+        # Keep the longest report (e.g. the amended one), then the first Log#
+        members.sort(key=lambda i: lsh.keys[i])
+        keep = max(members, key=lambda i: lengths[lsh.keys[i]])
+        duplicates = [
+            (lsh.keys[i], round(lsh.similarity(keep, i), 3))
+            for i in members
+            if i != keep
+        ]
+        clusters.append({"keep": lsh.keys[keep], "duplicates": duplicates})
+
+    clusters.sort(key=lambda cluster: cluster["keep"])
+    if print_progress:
+        print(f"{len(clusters)} clusters of near-duplicate reports")
+    return clusters
+
+
+def write_skip_list(clusters, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Log#", "duplicate_of", "similarity"])
+        for cluster in clusters:
+            for log_number, similarity in cluster["duplicates"]:
+                writer.writerow([log_number, cluster["keep"], similarity])
+
+
+def load_skip_list(path):
+    """Returns the set of Log#s listed in a skip list"""
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return {row["Log#"] for row in csv.DictReader(f)}
+
+
+if __name__ == "__main__":
+    from text_parser import TextParser
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate reports")
+    parser.add_argument("text_folder", help="folder with the <Log#>.txt files")
+    parser.add_argument("--output", default="duplicates.csv", help="skip list path")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--shingle-size", type=int, default=SHINGLE_SIZE)
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM)
+    parser.add_argument("--bands", type=int, default=BANDS)
+    parser.add_argument("--max-bucket-size", type=int, default=MAX_BUCKET_SIZE)
+    args = parser.parse_args()
+
+    text_parser = TextParser(args.text_folder, nlp_task="summarization")
+    clusters = find_duplicates(
+        text_parser,
+        threshold=args.threshold,
+        shingle_size=args.shingle_size,
+        num_perm=args.num_perm,
+        bands=args.bands,
+        max_bucket_size=args.max_bucket_size,
+        print_progress=True,
+    )
+    write_skip_list(clusters, args.output)
+    print(f"Skip list written to {args.output}")
@@ -0,0 +1,263 @@
+"""
+This script builds a sparse document-term matrix (SciPy CSR) straight from
+the tokens of TextParser.process_file, without joining them into strings
+that a vectorizer would split again. Two modes are supported:
+
+- exact: one column per word, the vocabulary is returned sorted
+  alphabetically, as in sklearn's CountVectorizer.
+- hashing: the column of a word is its CRC32 modulo n_features, so there
+  is no vocabulary to keep in memory or to merge.
+
+Document-frequency pruning (min_df / max_df, absolute counts or fractions
+of the documents) is applied to the counts collected in the same pass.
+With workers > 1, chunks of reports are counted in a process pool and the
+partial matrices are merged in order.
+
+    python dtm_builder.py ../../data/pdfs/text_files ../../data/dtm --stem --min-df 5
+"""
+
+import argparse
+import json
+import zlib
+from array import array
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+from text_parser import CHUNK_SIZE, get_worker_parser, map_chunks
+
+# Columns in hashing mode
+N_FEATURES = 2**20
+
+
+def hash_token(token, n_features):
+    # Python's hash() is salted per process, CRC32 is the same everywhere
+    return zlib.crc32(token.encode("utf-8")) % n_features
+
+
+def count_documents(documents, hashing=False, n_features=N_FEATURES):
+    """
+    Counts the tokens of each document. Returns a partial matrix as
+    (words, indptr, indices, data): in exact mode the columns index the
+    local list of words, in hashing mode words is None.
+    """
+    vocabulary = {}
+    indptr = array("q", [0])
+    indices = array("q")
+    data = array("q")
+
+    for tokens in documents:
+        counts = Counter(tokens)
+        if hashing:
+            columns = [hash_token(token, n_features) for token in counts]
+            # Different words can share a bucket
+            if len(set(columns)) != len(columns):
+                merged = Counter()
+                for column, count in zip(columns, counts.values()):
+                    merged[column] += count
+                columns, values = list(merged), list(merged.values())
+            else:
+                values = list(counts.values())
+        else:
+            columns = [vocabulary.setdefault(token, len(vocabulary)) for token in counts]
+            values = list(counts.values())
+
+        indices.extend(columns)
+        data.extend(values)
+        indptr.append(len(indices))
+
+    words = None if hashing else list(vocabulary)
+    return words, indptr, indices, data
+
+
+def merge_partials(partials, hashing=False, n_features=N_FEATURES):
+    """
+    Stacks the partial matrices in order. In exact mode the columns are
+    remapped to a vocabulary sorted alphabetically.
+    Returns (matrix, vocabulary).
+    """
+    indptrs = []
+    indices = []
+    data = []
+    offset = 0
+    vocabulary = {}
+
+    for words, partial_indptr, partial_indices, partial_data in partials:
+        partial_indptr = np.frombuffer(partial_indptr, dtype=np.int64)
+        partial_indices = np.frombuffer(partial_indices, dtype=np.int64)
+        if not hashing:
+            remap = np.array(
+                [vocabulary.setdefault(word, len(vocabulary)) for word in words],
+                dtype=np.int64,
+            )
+            partial_indices = remap[partial_indices] if len(remap) else partial_indices
+
+        indptrs.append(partial_indptr[1:] + offset)
+        indices.append(partial_indices)
+        data.append(np.frombuffer(partial_data, dtype=np.int64))
+        offset += len(partial_indices)
+
+    indptr = np.concatenate([np.zeros(1, dtype=np.int64), *indptrs])
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+    data = np.concatenate(data) if data else np.zeros(0, dtype=np.int64)
+
+    if hashing:
+        n_columns = n_features
+        words = None
+    else:
+        words = np.array(list(vocabulary), dtype=object)
+        order = np.argsort(words, kind="stable")
+        new_columns = np.empty(len(order), dtype=np.int64)
+        new_columns[order] = np.arange(len(order))
+        indices = new_columns[indices] if len(indices) else indices
+        words = words[order].tolist()
+        n_columns = len(words)
+
+    matrix = sparse.csr_matrix(
+        (data, indices, indptr), shape=(len(indptr) - 1, n_columns)
+    )
+    matrix.sort_indices()
+    return matrix, words
+
+
+def get_df_bounds(n_documents, min_df, max_df):
+    """Turns min_df / max_df (int counts or float fractions) into counts"""
+    min_count = min_df if isinstance(min_df, int) else int(np.ceil(min_df * n_documents))
+    max_count = max_df if isinstance(max_df, int) else int(np.floor(max_df * n_documents))
+    return min_count, max_count
+
+
+def prune(matrix, vocabulary, min_df=1, max_df=1.0):
+    """
+    Drops the columns whose document frequency is outside [min_df, max_df].
+    In exact mode the pruned words are removed from the vocabulary; in
+    hashing mode the shape is kept and the buckets are emptied.
+    """
+    min_count, max_count = get_df_bounds(matrix.shape[0], min_df, max_df)
+    # Every document has each column at most once
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    keep = (document_frequency >= min_count) & (document_frequency <= max_count)
+    if keep.all():
+        return matrix, vocabulary
+
+    if vocabulary is None:
+        matrix = matrix.multiply(keep.astype(matrix.dtype)).tocsr()
+        matrix.eliminate_zeros()
+        return matrix, None
+
+    columns = np.flatnonzero(keep)
+    return matrix[:, columns], [vocabulary[i] for i in columns]
+
+
+def _count_chunk(args):
+    filenames, options, hashing, n_features = args
+    parser = get_worker_parser()
+    documents = (
+        parser.process_file(filename, return_as_list=True, **options)
+        for filename in filenames
+    )
+    return count_documents(documents, hashing, n_features)
+
+
+def build_dtm(
+    parser,
+    hashing=False,
+    n_features=N_FEATURES,
+    min_df=1,
+    max_df=1.0,
+    remove_stops=True,
+    stem_input=False,
+    lemmatize_input=False,
+    workers=1,
+    chunk_size=CHUNK_SIZE,
+    print_progress=False,
+):
+    """
+    Builds the document-term matrix of the parser's corpus, one row per
+    report in file name order.
+    Returns (matrix, vocabulary, log_numbers); vocabulary is None in
+    hashing mode.
+    """
+    filenames = parser.get_filenames()
+    options = {
+        "preprocess_input": True,
+        "remove_stops": remove_stops,
+        "stem_input": stem_input,
+        "lemmatize_input": lemmatize_input,
+    }
+
+    if workers > 1:
+        n_chunks = -(-len(filenames) // chunk_size)
+        partials = []
+        for partial in map_chunks(
+            parser,
+            _count_chunk,
+            filenames,
+            (options, hashing, n_features),
+            workers,
+            chunk_size,
+        ):
+            partials.append(partial)
+            if print_progress:
+                print(f"Counted {len(partials)} of {n_chunks} chunks...")
+    else:
+        documents = (
+            parser.process_file(filename, return_as_list=True, **options)
+            for filename in filenames
+        )
+        partials = [count_documents(documents, hashing, n_features)]
+
+    matrix, vocabulary = merge_partials(partials, hashing, n_features)
+    matrix, vocabulary = prune(matrix, vocabulary, min_df, max_df)
+    log_numbers = [parser.get_log_number(filename) for filename in filenames]
+
+    if print_progress:
+        print(f"Document-term matrix: {matrix.shape}, {matrix.nnz} non-zero")
+
+    return matrix, vocabulary, log_numbers
+
+
+def parse_df(value):
+    """Reads a --min-df / --max-df value as a count or a fraction"""
+    return float(value) if "." in value else int(value)
+
+
+if __name__ == "__main__":
+    from text_parser import TextParser
+
+    parser = argparse.ArgumentParser(description="Build a document-term matrix")
+    parser.add_argument("text_folder", help="folder with the <Log#>.txt files")
+    parser.add_argument("path", help="output path, without extension")
+    parser.add_argument("--stem", action="store_true")
+    parser.add_argument("--lemmatize", action="store_true")
+    parser.add_argument("--all-stops", action="store_true")
+    parser.add_argument("--hashing", type=int, metavar="N_FEATURES")
+    parser.add_argument("--min-df", type=parse_df, default=1)
+    parser.add_argument("--max-df", type=parse_df, default=1.0)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    text_parser = TextParser(
+        args.text_folder,
+        nlp_task="topic modeling",
+        add_custom_stops=args.all_stops,
+        findings_are_stops=args.all_stops,
+        names_are_stops=args.all_stops,
+        digraphs_are_stops=args.all_stops,
+    )
+    matrix, vocabulary, log_numbers = build_dtm(
+        text_parser,
+        hashing=args.hashing is not None,
+        n_features=args.hashing or N_FEATURES,
+        min_df=args.min_df,
+        max_df=args.max_df,
+        stem_input=args.stem,
+        lemmatize_input=args.lemmatize,
+        workers=args.workers,
+        print_progress=True,
+    )
+
+    sparse.save_npz(f"{args.path}.npz", matrix)
+    with open(f"{args.path}.json", "w", encoding="utf-8") as f:
+        json.dump({"log_numbers": log_numbers, "vocabulary": vocabulary}, f)
+    print(f"Matrix saved to {args.path}.npz")
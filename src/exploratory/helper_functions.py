@@ -1,5 +1,4 @@
-
-import spacy
+from model_registry import get_model
 
 
 def extract_entities_spacy(texts, entity_types=None, model="en_core_web_sm", batch_size=1000):
@@ -16,7 +15,8 @@ def extract_entities_spacy(texts, entity_types=None, model="en_core_web_sm", bat
     Returns:
     set: A set of unique entities extracted from the texts.
     """
-    nlp = spacy.load(model)
+    # spaCy is only imported, and each model only loaded, on first use
+    nlp = get_model("spacy", model)
     
     if isinstance(entity_types, str):
         entity_types = [entity_types]
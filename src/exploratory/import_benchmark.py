@@ -0,0 +1,62 @@
+"""
+This script measures how long importing the parsing modules takes in a
+fresh interpreter, which every short-lived worker process pays. It exits
+with an error if the median is above --max-ms, so it can guard against
+heavy imports (NLTK, the stop lists, models...) creeping back in at
+module level.
+
+    python import_benchmark.py text_parser --runs 10 --max-ms 150
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPT = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def time_import(module, runs=5):
+    """Returns the import time of a module in ms, once per fresh interpreter"""
+    times = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT.format(module=module)],
+            cwd=FOLDER,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(1000 * float(output.stdout.strip().splitlines()[-1]))
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure module import times")
+    parser.add_argument("modules", nargs="*", default=["text_parser"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="fail if the median import time of a module is above this",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        times = time_import(module, args.runs)
+        median = statistics.median(times)
+        print(f"{module}: median {median:.1f} ms, min {min(times):.1f} ms")
+        if args.max_ms is not None and median > args.max_ms:
+            print(f"{module} takes longer than {args.max_ms} ms to import")
+            failed = True
+
+    raise SystemExit(1 if failed else 0)
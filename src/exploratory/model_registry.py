@@ -0,0 +1,125 @@
+"""
+This script holds the models used by the NER, summarization and spaCy
+helpers. A model is loaded the first time it is asked for and then shared
+by everything in the process, keyed by its kind, name and loading options,
+so importing a module costs nothing and creating another ExtractEntities
+or Summarizer doesn't load BERT or BART again.
+
+How long every model took to load, and how many times it was reused, is
+kept in get_metrics():
+
+    python model_registry.py ner ctrlbuzz/bert-addresses
+"""
+
+import argparse
+import threading
+import time
+
+
+def load_ner(name, **options):
+    from transformers import pipeline
+
+    return pipeline("ner", model=name, tokenizer=name, **options)
+
+
+def load_seq2seq(name, **options):
+    """Returns the (model, tokenizer) pair of a summarization model"""
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(name, **options)
+    return model, AutoTokenizer.from_pretrained(name)
+
+
+def load_spacy(name, **options):
+    import spacy
+
+    return spacy.load(name, **options)
+
+
+LOADERS = {
+    "ner": load_ner,
+    "seq2seq": load_seq2seq,
+    "spacy": load_spacy,
+}
+
+# (kind, name, options) -> model, and its load time and reuses
+_models = {}
+_metrics = {}
+
+# (kind, name, options) -> lock held while the model loads, so two threads
+# asking for the same model don't load it twice while other models load
+# in parallel. _lock only guards the dicts.
+_key_locks = {}
+_lock = threading.Lock()
+
+
+def get_key(kind, name, options):
+    # repr makes options such as disable=["parser"] usable in the key
+    return (kind, name, repr(sorted(options.items())))
+
+
+def get_model(kind, name, **options):
+    """
+    Returns the shared model of the given kind ("ner", "seq2seq" or
+    "spacy"), loading it with the options on first use
+    """
+    if kind not in LOADERS:
+        raise ValueError(f"Unknown model kind {kind}, choose from {list(LOADERS)}")
+
+    key = get_key(kind, name, options)
+    with _lock:
+        if key in _models:
+            _metrics[key]["hits"] += 1
+            return _models[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        with _lock:
+            if key in _models:
+                # Loaded by another thread while this one waited
+                _metrics[key]["hits"] += 1
+                return _models[key]
+
+        start = time.perf_counter()
+        model = LOADERS[kind](name, **options)
+        seconds = time.perf_counter() - start
+
+        with _lock:
+            _models[key] = model
+            _metrics[key] = {"seconds": seconds, "hits": 0}
+    return model
+
+
+def get_metrics():
+    """Returns the load time in seconds and the number of reuses of every model"""
+    with _lock:
+        return [
+            {"kind": kind, "name": name, "options": options, **metrics}
+            for (kind, name, options), metrics in _metrics.items()
+        ]
+
+
+def clear():
+    """Drops every model, e.g. to free memory between experiments"""
+    with _lock:
+        _models.clear()
+        _metrics.clear()
+        _key_locks.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure model load times")
+    parser.add_argument("kind", choices=list(LOADERS))
+    parser.add_argument("names", nargs="+", help="model names")
+    args = parser.parse_args()
+
+    for name in args.names:
+        get_model(args.kind, name)
+        # The second call must come from the registry
+        get_model(args.kind, name)
+
+    for metrics in get_metrics():
+        print(
+            f"{metrics['kind']} {metrics['name']}: loaded in "
+            f"{metrics['seconds']:.2f} s, reused {metrics['hits']} times"
+        )
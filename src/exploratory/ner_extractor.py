@@ -5,17 +5,153 @@ to extract entities from a given text.
 Author: Jonathan Juarez
 """
 
+import time
+from collections import namedtuple
+
+import numpy as np
 import pandas as pd
-from transformers import pipeline
+from model_registry import get_model
+from sections import extract_sections
+
+# Windows per pipeline call in extract_entities_batch
+BATCH_SIZE = 16
+
+# Documents read ahead and sorted by length before being batched
+BUFFER_SIZE = 256
+
+# Tokens per window (512 minus [CLS] and [SEP]) and tokens shared by
+# consecutive windows
+WINDOW_SIZE = 510
+STRIDE = 128
+
+# Character spans of a window in its text. Entities of the overlaps are
+# taken from the window whose [owned_start, owned_end) holds them.
+Window = namedtuple(
+    "Window", ["token_start", "n_tokens", "start", "end", "owned_start", "owned_end"]
+)
+
+
+# Marks the start of every run in join_runs, never found in a token
+RUN_SEPARATOR = "\x1f"
+
+
+def iter_buffers(documents, buffer_size):
+    """Groups an iterable of documents in lists of buffer_size"""
+    buffer = []
+    for document in documents:
+        buffer.append(document)
+        if len(buffer) == buffer_size:
+            yield buffer
+            buffer = []
+    if buffer:
+        yield buffer
+
+
+def split_windows(offsets, window_size=WINDOW_SIZE, stride=STRIDE):
+    """
+    Splits a text in windows of at most window_size tokens, each sharing
+    about stride tokens with the previous one, given the (start, end)
+    character offsets of its tokens. Windows start and end on word
+    boundaries, so a window tokenizes as the same tokens of the whole text.
+    """
+    if not 0 <= stride < window_size:
+        raise ValueError("stride must be smaller than window_size")
+
+    def word_start(i, lowest):
+        # Moves back to the first token of the word (e.g. before "##s")
+        while i > lowest and offsets[i][0] == offsets[i - 1][1]:
+            i -= 1
+        return i
+
+    spans = []
+    token_start = 0
+    while token_start < len(offsets):
+        token_end = len(offsets)
+        if token_start + window_size < len(offsets):
+            token_end = word_start(token_start + window_size, token_start + 1)
+        spans.append((token_start, token_end))
+        if token_end == len(offsets):
+            break
+        token_start = word_start(
+            max(token_end - stride, token_start + 1), token_start + 1
+        )
+
+    # Each window owns its tokens up to the middle of the overlap with the next
+    owned_starts = [0]
+    for (token_start, _), (_, previous_end) in zip(spans[1:], spans):
+        middle = word_start((token_start + previous_end) // 2, token_start)
+        owned_starts.append(offsets[middle][0])
+    owned_ends = owned_starts[1:] + [offsets[-1][1] if offsets else 0]
+
+    return [
+        Window(
+            token_start,
+            token_end - token_start,
+            offsets[token_start][0],
+            offsets[token_end - 1][1],
+            owned_start,
+            owned_end,
+        )
+        for (token_start, token_end), owned_start, owned_end in zip(
+            spans, owned_starts, owned_ends
+        )
+    ]
+
+
+def shift_entities(entities, window):
+    """
+    Moves the entities of a window to the offsets of the whole text and
+    drops the ones owned by a neighbouring window
+    """
+    shifted = []
+    for entity in entities:
+        start = entity["start"] + window.start
+        if window.owned_start <= start < window.owned_end:
+            shifted.append(
+                {
+                    **entity,
+                    "start": start,
+                    "end": entity["end"] + window.start,
+                    "index": entity["index"] + window.token_start,
+                }
+            )
+    return shifted
 
 
 class ExtractEntities:
-    def __init__(self, model="dbmdz/bert-large-cased-finetuned-conll03-english"):
+    def __init__(
+        self,
+        model="dbmdz/bert-large-cased-finetuned-conll03-english",
+        window_size=WINDOW_SIZE,
+        stride=STRIDE,
+    ):
         self.model = model
-        self.nlp = pipeline("ner", model=model, tokenizer=model)
+        # Loaded once per process and shared by every ExtractEntities(model)
+        self.nlp = get_model("ner", model)
+        # Longer texts are split in overlapping windows of window_size tokens
+        self.window_size = window_size
+        self.stride = stride
+
+    def extract_entities(self, text, counts=False, sections=None):
+        # With sections, text must be the raw report and only those
+        # sections (e.g. ["involved_parties", "allegations"]) are read
+        if sections is not None:
+            text = extract_sections(text, sections)
+        return self.count_entities(self.find_entities(text), counts)
+
+    def find_entities(self, text):
+        """
+        Returns the pipeline output for the whole text, with character
+        offsets into the text, however long it is
+        """
+        entities = []
+        for completed, _ in self.run_windows([text]):
+            for _, text_entities in completed:
+                entities.extend(text_entities)
+        return entities
 
-    def extract_entities(self, text, counts=False):
-        entities = self.nlp(text)
+    def count_entities(self, entities, counts=False):
+        """Groups the pipeline output by (word, entity)"""
         entity_counts = {}
         for ent in entities:
             key = (ent["word"], ent["entity"])
@@ -29,6 +165,108 @@ class ExtractEntities:
         else:
             return [(entity, label) for (entity, label) in entity_counts.keys()]
 
+    def get_windows(self, text):
+        # The offsets need a fast tokenizer, the default for BERT models
+        offsets = self.nlp.tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True
+        )["offset_mapping"]
+        return split_windows(offsets, self.window_size, self.stride)
+
+    def run_windows(self, texts, batch_size=BATCH_SIZE):
+        """
+        Runs the pipeline over the windows of all the texts, sorted by length
+        and batch_size at a time. After every batch, yields the texts whose
+        windows are all done, as [(i, entities), ...], and the number of
+        tokens in the batch.
+        """
+        windows = [
+            (i, window)
+            for i, text in enumerate(texts)
+            for window in self.get_windows(text)
+        ]
+        remaining = {}
+        for i, _ in windows:
+            remaining[i] = remaining.get(i, 0) + 1
+        entities = {i: [] for i in remaining}
+
+        # Empty texts have no windows
+        empty = [(i, []) for i in range(len(texts)) if i not in remaining]
+        if empty or not windows:
+            yield empty, 0
+
+        windows.sort(key=lambda item: item[1].n_tokens)
+        for n in range(0, len(windows), batch_size):
+            batch = windows[n : n + batch_size]
+            outputs = self.nlp(
+                [texts[i][window.start : window.end] for i, window in batch],
+                batch_size=batch_size,
+            )
+
+            completed = []
+            for (i, window), output in zip(batch, outputs):
+                entities[i].extend(shift_entities(output, window))
+                remaining[i] -= 1
+                if not remaining[i]:
+                    text_entities = sorted(entities.pop(i), key=lambda e: e["start"])
+                    completed.append((i, text_entities))
+            yield completed, sum(window.n_tokens for _, window in batch)
+
+    def extract_entities_batch(
+        self,
+        documents,
+        counts=False,
+        sections=None,
+        batch_size=BATCH_SIZE,
+        buffer_size=BUFFER_SIZE,
+        print_progress=False,
+    ):
+        """
+        Runs the pipeline over an iterable of (report_number, text) and
+        yields (report_number, entities) as each report completes, with the
+        entities as in extract_entities. The windows of every buffer_size
+        reports are sorted by token length before being batched, so the
+        windows of a batch need little padding; the results are therefore
+        not in input order. The throughput is kept in self.stats.
+        """
+        self.stats = {
+            "documents": 0,
+            "tokens": 0,
+            "seconds": 0.0,
+            "documents_per_second": 0.0,
+            "tokens_per_second": 0.0,
+        }
+        start = time.perf_counter()
+
+        for buffer in iter_buffers(documents, buffer_size):
+            report_numbers = [report_number for report_number, _ in buffer]
+            texts = [text for _, text in buffer]
+            if sections is not None:
+                texts = [extract_sections(text, sections) for text in texts]
+
+            for completed, tokens in self.run_windows(texts, batch_size):
+                for i, entities in completed:
+                    yield report_numbers[i], self.count_entities(entities, counts)
+
+                self.update_stats(len(completed), tokens, start)
+                if print_progress:
+                    print(
+                        f"{self.stats['documents']} documents, "
+                        f"{self.stats['documents_per_second']:.2f} docs/sec, "
+                        f"{self.stats['tokens_per_second']:.0f} tokens/sec"
+                    )
+
+    def update_stats(self, documents, tokens, start):
+        self.stats["documents"] += documents
+        self.stats["tokens"] += tokens
+        self.stats["seconds"] = time.perf_counter() - start
+        if self.stats["seconds"]:
+            self.stats["documents_per_second"] = (
+                self.stats["documents"] / self.stats["seconds"]
+            )
+            self.stats["tokens_per_second"] = (
+                self.stats["tokens"] / self.stats["seconds"]
+            )
+
     def aggregate_subwords(self, entities):
         corrected_entities = []
         previous_entity = ""
@@ -55,92 +293,125 @@ class ExtractEntities:
 
         return corrected_entities
 
-    def create_dataframe(self, report_number, text, counts=False):
-        extracted_entities = self.extract_entities(text, counts)
+    def create_dataframe(self, report_number, text, counts=False, sections=None):
+        extracted_entities = self.extract_entities(text, counts, sections)
         corrected_entities = self.aggregate_subwords(extracted_entities)
         df = pd.DataFrame(corrected_entities, columns=["entity", "label", "count"])
         df["report_number"] = report_number
         return df
 
+    def create_dataframe_batch(self, documents, counts=False, sections=None, **kwargs):
+        """
+        Same as create_dataframe for an iterable of (report_number, text),
+        run with extract_entities_batch and returned as a single DataFrame
+        """
+        rows = []
+        for report_number, entities in self.extract_entities_batch(
+            documents, True, sections, **kwargs
+        ):
+            for entity, label, count in entities:
+                rows.append((entity, label, count, report_number))
+        df = merge_subwords(
+            pd.DataFrame(rows, columns=["entity", "label", "count", "report_number"])
+        )
+        return df if counts else df.drop(columns="count")
 
-# example of usage:
 
-# Load and preprocess the data
-# cases = os.listdir(text_files_dir)
-# cases = [case for case in cases if case.endswith(".txt")]
-# random.seed(43)
-# cases = random.sample(cases, 5)  # Randomly select 5 cases
+def get_report_starts(df):
+    """Marks the rows where a new report starts (reports are contiguous)"""
+    # Codes instead of values, NaN != NaN would start a report on every row
+    report_numbers, _ = pd.factorize(df["report_number"], use_na_sentinel=False)
+    report_starts = np.ones(len(df), dtype=bool)
+    report_starts[1:] = report_numbers[1:] != report_numbers[:-1]
+    return report_starts
 
-# texts = []
-# for case in cases:
-#     # Extract the report number from the filename (assuming format '1234567.txt')
-#     report_number = case.split('.')[0]
-#     with open(os.path.join(PATH, case), 'r') as file:
-#         text = file.read()
-#     # Store the tuple (report_number, case_text)
-#     texts.append((report_number, text))
 
-# Call ExtractEntities, specify model bert-addresses for most usable ner model
+def join_runs(pieces, run_starts):
+    """
+    Concatenates the strings of every run of rows, run_starts marking the
+    first row of each run, with a single join and split
+    """
+    pieces = pd.Series(pieces, dtype=object)
+    marked = pieces.where(~run_starts, RUN_SEPARATOR + pieces)
+    return "".join(marked.tolist()).split(RUN_SEPARATOR)[1:]
 
-extractor = ExtractEntities(model="ctrlbuzz/bert-addresses")
 
-# create list of dataframes if processing more then one report
-# dataframes = []
-# for report_number, text in texts:
-#     df = extractor.create_dataframe(report_number, text, counts=True)
-#     dataframes.append(df)
+def merge_subwords(df):
+    """
+    Same as ExtractEntities.aggregate_subwords for the entities of many
+    reports at once: every "##" piece is appended to the previous entity of
+    its report (adding up the counts), and pieces with no entity before them
+    are dropped. A missing entity is read as an empty string.
+    """
+    # String operations run on the distinct tokens only. Without fillna,
+    # factorize codes NaN as -1, which would read the last distinct token.
+    codes, tokens = pd.factorize(df["entity"].fillna(""))
+    tokens = pd.Series(tokens, dtype=object).astype(str)
+    is_subword = tokens.str.startswith("##").to_numpy()[codes]
 
-# # Concatenate all dataframes to have one unified dataframe
-# final_df = pd.concat(dataframes, ignore_index=True)
+    # Every entity starts a run that its "##" pieces join
+    run_starts = ~is_subword | get_report_starts(df)
+    runs = np.cumsum(run_starts) - 1
+    keep = ~is_subword[run_starts][runs]
+    pieces = tokens.where(~tokens.str.startswith("##"), tokens.str[2:])
+    pieces = pieces.to_numpy()[codes[keep]]
+    run_starts = run_starts[keep]
+    first_rows = np.flatnonzero(keep)[run_starts]
 
-# Use aggregate_entities to create full entities without seperation
+    merged = pd.DataFrame(
+        {
+            "entity": join_runs(pieces, run_starts),
+            "label": df["label"].to_numpy()[first_rows],
+            "report_number": df["report_number"].to_numpy()[first_rows],
+        }
+    )
+    if "count" in df:
+        counts = df["count"].to_numpy()[keep]
+        if len(counts):
+            counts = np.add.reduceat(counts, np.flatnonzero(run_starts))
+        merged["count"] = counts
+    return merged[[column for column in df.columns if column in merged]]
 
 
 def aggregate_entities(df):
-    aggregated_entities = []
-    current_entity = ""
-    current_label = ""
-    report_number = ""
-
-    for i, row in df.iterrows():
-        if "B-" in row["label"]:
-            if current_entity:  # Add the previous entity
-                aggregated_entities.append(
-                    {
-                        "entity": current_entity,
-                        "label": current_label,
-                        "report_number": report_number,
-                    }
-                )
-            current_entity = row["entity"]
-            current_label = row["label"].split("-")[1]  # Update the label
-            report_number = row["report_number"]
-        elif "I-" in row["label"]:
-            current_entity += f" {row['entity']}"
-        else:  # Handle 'O' labels or other cases
-            if current_entity:  # Add the last entity
-                aggregated_entities.append(
-                    {
-                        "entity": current_entity,
-                        "label": current_label,
-                        "report_number": report_number,
-                    }
-                )
-                current_entity = ""
-                current_label = ""
-                report_number = ""
-
-    # Add the final entity if it exists
-    if current_entity:
-        aggregated_entities.append(
-            {
-                "entity": current_entity,
-                "label": current_label,
-                "report_number": report_number,
-            }
-        )
+    """
+    Joins the B-/I- runs of the entities of many reports (e.g. "John" B-PER,
+    "Doe" I-PER -> "John Doe" PER). A run ends at the next B- or O label or
+    at the end of its report; an I- label with no run to continue starts
+    one. A missing label is read as O and a missing entity as an empty
+    string. Returns a single table with categorical label and report_number.
+    """
+    # String operations run on the distinct labels and tokens only. Without
+    # fillna, factorize codes NaN as -1, which would read the last distinct
+    # value.
+    label_codes, labels = pd.factorize(df["label"].fillna("O"))
+    labels = pd.Series(labels, dtype=object).astype(str)
+    is_begin = labels.str.startswith("B-").to_numpy()[label_codes]
+    is_inside = labels.str.startswith("I-").to_numpy()[label_codes]
+    is_tagged = is_begin | is_inside
+
+    continues = is_inside & ~get_report_starts(df)
+    continues[1:] &= is_tagged[:-1]
+    run_starts = is_tagged & ~continues
+    first_rows = np.flatnonzero(run_starts)
+
+    codes, tokens = pd.factorize(df["entity"].fillna(""))
+    tokens = pd.Series(tokens, dtype=object).astype(str)
+    pieces = np.where(
+        continues, (" " + tokens).to_numpy()[codes], tokens.to_numpy()[codes]
+    )[is_tagged]
 
-    return pd.DataFrame(aggregated_entities)
+    return pd.DataFrame(
+        {
+            "entity": join_runs(pieces, run_starts[is_tagged]),
+            "label": pd.Categorical(
+                labels.str[2:].to_numpy()[label_codes[first_rows]]
+            ),
+            "report_number": pd.Categorical(
+                df["report_number"].to_numpy()[first_rows]
+            ),
+        }
+    )
 
 
 # Example:
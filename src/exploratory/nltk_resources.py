@@ -0,0 +1,28 @@
+"""
+This script contains the checks for the NLTK data used by the parsers.
+Resources are only looked up when they are first needed, and only
+downloaded if they are missing, instead of trying the network on every
+import.
+"""
+
+RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "wordnet": "corpora/wordnet",
+}
+
+# Resources already found in this process
+_found = set()
+
+
+def require(name):
+    """Makes sure an NLTK resource is installed, downloading it if needed"""
+    if name in _found:
+        return
+
+    import nltk
+
+    try:
+        nltk.data.find(RESOURCES[name])
+    except LookupError:
+        nltk.download(name)
+    _found.add(name)
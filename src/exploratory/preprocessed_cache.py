@@ -0,0 +1,91 @@
+"""
+This script contains an on-disk cache for the output of
+TextParser.preprocess, stored per report in a SQLite file. Entries are
+keyed by a fingerprint of the preprocessing settings (see
+TextParser.get_fingerprint) and by the Log#, and are only used if the
+hash of the report's raw text did not change, so adding or updating
+reports only preprocesses those.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def fingerprint(settings):
+    """SHA-256 of a JSON-serializable description of the settings"""
+    data = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class PreprocessedCache:
+    """
+    Stores one row per (fingerprint, Log#) with the hash of the raw text
+    and the preprocessed text or tokens as JSON
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # SQLite connections can't be pickled or shared with child processes
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    def connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "fingerprint TEXT, log_number TEXT, source_hash TEXT, data TEXT, "
+                "PRIMARY KEY (fingerprint, log_number))"
+            )
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def get(self, settings_fingerprint, log_number, source_hash):
+        """Returns the cached output for a report, or None on a miss"""
+        row = (
+            self.connect()
+            .execute(
+                "SELECT source_hash, data FROM documents "
+                "WHERE fingerprint = ? AND log_number = ?",
+                (settings_fingerprint, log_number),
+            )
+            .fetchone()
+        )
+        if row is None or row[0] != source_hash:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, settings_fingerprint, log_number, source_hash, data):
+        connection = self.connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                (settings_fingerprint, log_number, source_hash, json.dumps(data)),
+            )
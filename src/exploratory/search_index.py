@@ -0,0 +1,540 @@
+"""
+This script contains a full-text search index over the reports, stored in
+a single SQLite file. Reports are tokenized with TextParser.process_file
+(stop words removed, stemmed by default), so queries match the same
+normalized words the models see.
+
+Every term has a postings list of (document, positions) encoded as
+delta varints. Reports are added in batches, each batch writes a new
+segment per term, so new reports can be added at any time; optimize()
+merges the segments. A report whose text changed is re-indexed and its
+old version is ignored. The decoded postings of the terms queried last
+are kept in memory, so repeated query terms aren't decoded again.
+
+Queries are ranked with BM25. Words between double quotes are a phrase
+that must appear in that order, and results can be filtered with the
+metadata of copa_data.csv (district, incident and notification dates).
+
+    python search_index.py add ../../data/pdfs/text_files ../../data/search.sqlite
+    python search_index.py search ../../data/search.sqlite '"excessive force" taser' --district 06
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import re
+import sqlite3
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+from preprocessed_cache import hash_text
+
+METADATA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "../../data/copa_data.csv"
+)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Reports per segment written by add()
+BATCH_SIZE = 500
+
+# Terms whose decoded postings are kept in memory between queries
+POSTINGS_CACHE_SIZE = 10_000
+
+PHRASE = re.compile(r'"([^"]*)"')
+
+
+def encode_varints(numbers):
+    """Encodes non-negative integers with 7 bits per byte"""
+    data = bytearray()
+    for number in numbers:
+        while number >= 0x80:
+            data.append((number & 0x7F) | 0x80)
+            number >>= 7
+        data.append(number)
+    return bytes(data)
+
+
+def decode_varints(data):
+    numbers = []
+    number = 0
+    shift = 0
+    for byte in data:
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(number)
+            number = 0
+            shift = 0
+    return numbers
+
+
+def encode_postings(postings):
+    """
+    Encodes a list of (doc_id, positions), sorted by doc_id, as
+    doc_id delta, term frequency, position deltas...
+    """
+    numbers = []
+    previous_doc = 0
+    for doc_id, positions in postings:
+        numbers.append(doc_id - previous_doc)
+        numbers.append(len(positions))
+        previous_position = 0
+        for position in positions:
+            numbers.append(position - previous_position)
+            previous_position = position
+        previous_doc = doc_id
+    return encode_varints(numbers)
+
+
+def decode_postings(data):
+    numbers = decode_varints(data)
+    postings = []
+    doc_id = 0
+    i = 0
+    while i < len(numbers):
+        doc_id += numbers[i]
+        frequency = numbers[i + 1]
+        positions = []
+        position = 0
+        for delta in numbers[i + 2 : i + 2 + frequency]:
+            position += delta
+            positions.append(position)
+        postings.append((doc_id, positions))
+        i += 2 + frequency
+    return postings
+
+
+def parse_date(value, date_format):
+    """Returns an ISO date, or None if the value is missing or malformed"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.datetime.strptime(value.strip(), date_format).date().isoformat()
+    except ValueError:
+        return None
+
+
+def normalize_district(value):
+    """
+    Returns the district as two digits ("6", "06" and "6.0" are all "06"
+    in copa_data.csv), other values ("Other") stripped, None if missing
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return str(int(float(value))).zfill(2)
+    except ValueError:
+        return value.strip()
+
+
+def load_metadata(metadata_path=METADATA_PATH):
+    """Returns {Log#: {district, incident_date, notification_date}}"""
+    data = pd.read_csv(metadata_path, dtype=str)
+    metadata = {}
+    for log_number, district, incident, notification in zip(
+        data["Log#"],
+        data["District of Occurrence"],
+        data["Incident Date & Time"],
+        data["COPA Notification Date"],
+    ):
+        metadata[log_number] = {
+            "district": normalize_district(district),
+            "incident_date": parse_date(incident, "%m/%d/%Y %I:%M %p"),
+            "notification_date": parse_date(notification, "%m/%d/%Y"),
+        }
+    return metadata
+
+
+class SearchIndex:
+    """
+    BM25 index of the reports of a TextParser. The parser settings (stop
+    words, stemming...) are part of the index: opening it with a parser
+    that tokenizes differently raises a ValueError.
+    """
+
+    def __init__(self, path, parser, remove_stops=True, stem=True, lemmatize=False):
+        self.path = path
+        self.parser = parser
+        self.options = {
+            "preprocess_input": True,
+            "remove_stops": remove_stops,
+            "stem_input": stem,
+            "lemmatize_input": lemmatize,
+            "return_as_list": True,
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id INTEGER PRIMARY KEY,
+                log_number TEXT,
+                source_hash TEXT,
+                length INTEGER,
+                deleted INTEGER DEFAULT 0,
+                district TEXT,
+                incident_date TEXT,
+                notification_date TEXT
+            );
+            CREATE INDEX IF NOT EXISTS documents_log ON documents (log_number);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT, segment INTEGER, data BLOB,
+                PRIMARY KEY (term, segment)
+            );
+            """
+        )
+
+        fingerprint = parser.get_fingerprint(self.options)
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'fingerprint'"
+        ).fetchone()
+        if row is None:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO meta VALUES ('fingerprint', ?)", (fingerprint,)
+                )
+        elif row[0] != fingerprint:
+            raise ValueError(
+                f"{path} was built with different preprocessing settings, "
+                "rebuild it or open it with the same TextParser settings"
+            )
+
+        self.normalize_districts()
+        self.load_documents()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def normalize_districts(self):
+        """Rewrites the districts stored by older versions in canonical form"""
+        districts = [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT DISTINCT district FROM documents WHERE district IS NOT NULL"
+            )
+        ]
+        updates = [
+            (normalize_district(district), district)
+            for district in districts
+            if normalize_district(district) != district
+        ]
+        if updates:
+            with self.connection:
+                self.connection.executemany(
+                    "UPDATE documents SET district = ? WHERE district = ?", updates
+                )
+
+    def load_documents(self):
+        """Keeps the Log# and length of the live documents in memory"""
+        # The cached postings only hold the documents that were live
+        self.postings_cache = OrderedDict()
+        self.documents = {}
+        self.hashes = {}
+        for doc_id, log_number, source_hash, length in self.connection.execute(
+            "SELECT doc_id, log_number, source_hash, length FROM documents "
+            "WHERE deleted = 0"
+        ):
+            self.documents[doc_id] = (log_number, length)
+            self.hashes[log_number] = source_hash
+
+        total_length = sum(length for _, length in self.documents.values())
+        self.average_length = total_length / len(self.documents) if self.documents else 0
+
+    def tokenize(self, text):
+        return self.parser.preprocess(
+            text,
+            remove_stops=self.options["remove_stops"],
+            stem=self.options["stem_input"],
+            lemmatize=self.options["lemmatize_input"],
+            return_as_list=True,
+        )
+
+    def add(self, filenames=None, metadata=None, batch_size=BATCH_SIZE):
+        """
+        Indexes the parser's reports (all by default) that are new or whose
+        text changed. metadata is the output of load_metadata.
+        Returns the number of reports indexed.
+        """
+        if filenames is None:
+            filenames = self.parser.get_filenames()
+        metadata = metadata or {}
+
+        next_doc_id = (
+            self.connection.execute("SELECT MAX(doc_id) FROM documents").fetchone()[0]
+            or 0
+        ) + 1
+        next_segment = (
+            self.connection.execute("SELECT MAX(segment) FROM postings").fetchone()[0]
+            or 0
+        ) + 1
+
+        indexed = 0
+        batch = defaultdict(list)
+        rows = []
+        for filename in filenames:
+            log_number = self.parser.get_log_number(filename)
+            text = self.parser.read_text(filename)
+            source_hash = hash_text(text)
+            if self.hashes.get(log_number) == source_hash:
+                continue
+
+            tokens = self.parser.process_file(filename, **self.options)
+            positions = defaultdict(list)
+            for position, token in enumerate(tokens):
+                positions[token].append(position)
+            for term, term_positions in positions.items():
+                batch[term].append((next_doc_id, term_positions))
+
+            extra = metadata.get(log_number, {})
+            rows.append(
+                (
+                    next_doc_id,
+                    log_number,
+                    source_hash,
+                    len(tokens),
+                    extra.get("district"),
+                    extra.get("incident_date"),
+                    extra.get("notification_date"),
+                )
+            )
+            next_doc_id += 1
+            indexed += 1
+
+            if len(rows) == batch_size:
+                self.write_segment(next_segment, batch, rows)
+                next_segment += 1
+                batch = defaultdict(list)
+                rows = []
+
+        if rows:
+            self.write_segment(next_segment, batch, rows)
+
+        self.load_documents()
+        return indexed
+
+    def write_segment(self, segment, batch, rows):
+        log_numbers = [(row[1],) for row in rows]
+        with self.connection:
+            # The previous versions of re-indexed reports are ignored
+            self.connection.executemany(
+                "UPDATE documents SET deleted = 1 WHERE log_number = ?", log_numbers
+            )
+            self.connection.executemany(
+                "INSERT INTO documents (doc_id, log_number, source_hash, length, "
+                "district, incident_date, notification_date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?)",
+                [
+                    (term, segment, encode_postings(postings))
+                    for term, postings in batch.items()
+                ],
+            )
+
+    def optimize(self):
+        """Merges the segments of every term and drops the deleted reports"""
+        with self.connection:
+            terms = [
+                row[0]
+                for row in self.connection.execute("SELECT DISTINCT term FROM postings")
+            ]
+            for term in terms:
+                postings = self.get_postings(term)
+                self.connection.execute("DELETE FROM postings WHERE term = ?", (term,))
+                if postings:
+                    self.connection.execute(
+                        "INSERT INTO postings VALUES (?, 0, ?)",
+                        (term, encode_postings(sorted(postings.items()))),
+                    )
+            self.connection.execute("DELETE FROM documents WHERE deleted = 1")
+        self.connection.execute("VACUUM")
+
+    def get_postings(self, term):
+        """
+        Returns {doc_id: positions} for the live documents with the term.
+        Decoding the varints is the slow part of a query, so the postings
+        of the last POSTINGS_CACHE_SIZE terms are kept decoded.
+        """
+        if term in self.postings_cache:
+            self.postings_cache.move_to_end(term)
+            return self.postings_cache[term]
+
+        postings = {}
+        for (data,) in self.connection.execute(
+            "SELECT data FROM postings WHERE term = ? ORDER BY segment", (term,)
+        ):
+            for doc_id, positions in decode_postings(data):
+                if doc_id in self.documents:
+                    postings[doc_id] = positions
+
+        self.postings_cache[term] = postings
+        if len(self.postings_cache) > POSTINGS_CACHE_SIZE:
+            self.postings_cache.popitem(last=False)
+        return postings
+
+    def filter_documents(
+        self, district=None, date_from=None, date_to=None, date="incident_date"
+    ):
+        """Returns the doc_ids that match the metadata filters, None if no filter"""
+        if district is None and date_from is None and date_to is None:
+            return None
+        if date not in ("incident_date", "notification_date"):
+            raise ValueError("date must be incident_date or notification_date")
+
+        conditions = ["deleted = 0"]
+        parameters = []
+        if district is not None:
+            conditions.append("district = ?")
+            parameters.append(normalize_district(district))
+        if date_from is not None:
+            conditions.append(f"{date} >= ?")
+            parameters.append(date_from)
+        if date_to is not None:
+            conditions.append(f"{date} <= ?")
+            parameters.append(date_to)
+
+        return {
+            row[0]
+            for row in self.connection.execute(
+                f"SELECT doc_id FROM documents WHERE {' AND '.join(conditions)}",
+                parameters,
+            )
+        }
+
+    def match_phrase(self, terms, allowed=None):
+        """Returns {doc_id: positions} of the documents with the terms in a row"""
+        postings = [self.get_postings(term) for term in terms]
+        if not postings or not all(postings):
+            return {}
+
+        doc_ids = set(postings[0])
+        for term_postings in postings[1:]:
+            doc_ids &= set(term_postings)
+        if allowed is not None:
+            doc_ids &= allowed
+
+        matches = {}
+        for doc_id in doc_ids:
+            starts = set(postings[0][doc_id])
+            for offset, term_postings in enumerate(postings[1:], start=1):
+                starts &= {position - offset for position in term_postings[doc_id]}
+                if not starts:
+                    break
+            if starts:
+                matches[doc_id] = sorted(starts)
+        return matches
+
+    def score(self, postings, scores):
+        """Adds the BM25 score of one term (or phrase) to scores"""
+        n_documents = len(self.documents)
+        frequency = len(postings)
+        idf = math.log(1 + (n_documents - frequency + 0.5) / (frequency + 0.5))
+        for doc_id, positions in postings.items():
+            tf = len(positions)
+            length = self.documents[doc_id][1]
+            norm = K1 * (1 - B + B * length / self.average_length)
+            scores[doc_id] += idf * tf * (K1 + 1) / (tf + norm)
+
+    def search(
+        self,
+        query,
+        limit=10,
+        district=None,
+        date_from=None,
+        date_to=None,
+        date="incident_date",
+    ):
+        """
+        Returns [(Log#, score)] of the best matching reports. Phrases in
+        double quotes are required, the other words are optional.
+        Dates are ISO strings (YYYY-MM-DD).
+        """
+        allowed = self.filter_documents(district, date_from, date_to, date)
+        scores = defaultdict(float)
+
+        required = None
+        for phrase in PHRASE.findall(query):
+            terms = self.tokenize(phrase)
+            if not terms:
+                continue
+            matches = self.match_phrase(terms, allowed)
+            required = set(matches) if required is None else required & set(matches)
+            self.score(matches, scores)
+
+        for term in dict.fromkeys(self.tokenize(PHRASE.sub(" ", query))):
+            postings = self.get_postings(term)
+            if allowed is not None:
+                postings = {d: p for d, p in postings.items() if d in allowed}
+            self.score(postings, scores)
+
+        if required is not None:
+            scores = {d: s for d, s in scores.items() if d in required}
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self.documents[doc_id][0], score) for doc_id, score in best]
+
+
+if __name__ == "__main__":
+    import time
+
+    from text_parser import TextParser
+
+    parser = argparse.ArgumentParser(description="Full-text search over the reports")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="index new or changed reports")
+    add_parser.add_argument("text_folder", help="folder with the <Log#>.txt files")
+    add_parser.add_argument("index", help="path of the SQLite index")
+    add_parser.add_argument("--metadata", default=METADATA_PATH)
+    add_parser.add_argument("--optimize", action="store_true")
+
+    search_parser = subparsers.add_parser("search", help="query the index")
+    search_parser.add_argument("index", help="path of the SQLite index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=10)
+    search_parser.add_argument("--district")
+    search_parser.add_argument("--from", dest="date_from", help="YYYY-MM-DD")
+    search_parser.add_argument("--to", dest="date_to", help="YYYY-MM-DD")
+    search_parser.add_argument("--text-folder", default=".")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        text_parser = TextParser(args.text_folder, nlp_task="topic modeling")
+        metadata = load_metadata(args.metadata) if os.path.exists(args.metadata) else {}
+        with SearchIndex(args.index, text_parser) as index:
+            print(f"Indexed {index.add(metadata=metadata)} reports")
+            if args.optimize:
+                index.optimize()
+    else:
+        text_parser = TextParser(args.text_folder, nlp_task="topic modeling")
+        with SearchIndex(args.index, text_parser) as index:
+            start = time.perf_counter()
+            results = index.search(
+                args.query,
+                limit=args.limit,
+                district=args.district,
+                date_from=args.date_from,
+                date_to=args.date_to,
+            )
+            elapsed = time.perf_counter() - start
+            for log_number, score in results:
+                print(f"{log_number}\t{score:.3f}")
+            print(json.dumps({"results": len(results), "ms": round(1000 * elapsed, 1)}))
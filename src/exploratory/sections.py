@@ -0,0 +1,186 @@
+"""
+This script splits a report into the sections of the FSR, using the
+section titles of SECTION_TITLES ("involved parties", "allegations",
+"conclusion", "recommended discipline"...).
+
+A heading is a line that only holds a section title, optionally numbered
+("II. ALLEGATIONS") and followed by a colon. Each section goes from the
+end of its heading to the next heading; the text before the first heading
+is the "preamble". Segmentation needs the raw text of the report (with its
+newlines), not the output of TextParser.file_to_string.
+
+The section index of every report is computed once and stored as
+<Log#>.json: the section name -> list of [start, end) character ranges in
+the text as TextParser.read_text returns it (universal newlines). The
+index also keeps the SHA-256 and length of that text and the size and
+mtime of the .txt file. Building checks the hash, so a changed report is
+segmented again; reading only compares the length, size and mtime, which
+is much cheaper than hashing, and ignores an index that doesn't match:
+
+    python sections.py ../../data/pdfs/text_files ../../data/pdfs/sections
+"""
+
+import argparse
+import json
+import os
+import re
+
+from preprocessed_cache import hash_text
+
+# Section name -> title as it appears in the reports
+SECTION_TITLES = {
+    "executive_summary": r"executive summary",
+    "involved_parties": r"involved parties",
+    "allegations": r"allegations",
+    "applicable_rules": r"applicable rules and laws",
+    "investigation": r"investigation",
+    "digital_evidence": r"digital evidence",
+    "documentary_evidence": r"documentary evidence",
+    "legal_standard": r"legal standard",
+    "analysis": r"analysis",
+    "conclusion": r"conclusions?",
+    "recommended_discipline": r"recommended (?:discipline|penalty)",
+}
+
+PREAMBLE = "preamble"
+
+# Every stored index has these keys
+INDEX_KEYS = {"sha256", "length", "size", "mtime", "sections"}
+
+HEADING = re.compile(
+    r"^[ \t]*(?:(?:[IVXL]+|[A-Z]|\d+)\.[ \t]*)?"
+    r"(?:"
+    + "|".join(f"(?P<{name}>{title})" for name, title in SECTION_TITLES.items())
+    + r")[ \t]*:?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def segment(text):
+    """
+    Returns {section name: [[start, end], ...]} for the sections found in
+    the text, in document order. A section can appear several times (e.g.
+    in a table of contents and in the body).
+    """
+    sections = {}
+    headings = [
+        (match.lastgroup, match.start(), match.end())
+        for match in HEADING.finditer(text)
+    ]
+
+    first_start = headings[0][1] if headings else len(text)
+    if text[:first_start].strip():
+        sections[PREAMBLE] = [[0, first_start]]
+
+    for i, (name, _, end) in enumerate(headings):
+        next_start = headings[i + 1][1] if i + 1 < len(headings) else len(text)
+        sections.setdefault(name, []).append([end, next_start])
+
+    return sections
+
+
+def extract_sections(text, names, sections=None, fallback=True):
+    """
+    Returns the text of the requested sections, in document order. If
+    none of them is found, returns the whole text (or "" if not fallback).
+    sections is the stored index of the text, computed if not given.
+    """
+    if sections is None:
+        sections = segment(text)
+
+    unknown = set(names) - set(SECTION_TITLES) - {PREAMBLE}
+    if unknown:
+        raise ValueError(
+            f"Unknown sections {sorted(unknown)}, choose from "
+            f"{[PREAMBLE, *SECTION_TITLES]}"
+        )
+
+    spans = sorted(span for name in names for span in sections.get(name, []))
+    if not spans:
+        return text if fallback else ""
+    return "\n\n".join(text[start:end].strip() for start, end in spans)
+
+
+def read_index(sections_path):
+    """Returns the stored index of a report, or None"""
+    if not os.path.exists(sections_path):
+        return None
+    with open(sections_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    # Older indexes were built on the text with its \r\n newlines, or
+    # can't be checked without hashing the text
+    if not INDEX_KEYS <= index.keys():
+        return None
+    return index
+
+
+def same_file(index, txt_path):
+    """Checks that the .txt file has the size and mtime recorded in the index"""
+    stat = os.stat(txt_path)
+    return index["size"] == stat.st_size and index["mtime"] == stat.st_mtime_ns
+
+
+def load_sections(log_number, sections_folder, text=None, txt_path=None):
+    """
+    Returns the stored section index of a report, or None if missing. With
+    the text of the report or the path of its .txt file, None is also
+    returned if the index doesn't match them.
+    """
+    index = read_index(os.path.join(sections_folder, f"{log_number}.json"))
+    if index is None:
+        return None
+    if text is not None and len(text) != index["length"]:
+        return None
+    if txt_path is not None and not same_file(index, txt_path):
+        return None
+    return index["sections"]
+
+
+def build_section_index(text_folder, sections_folder):
+    """
+    Segments every report whose text changed since its section index was
+    built. Returns the number of reports segmented.
+    """
+    os.makedirs(sections_folder, exist_ok=True)
+    segmented = 0
+    for filename in sorted(os.listdir(text_folder)):
+        if not filename.endswith(".txt"):
+            continue
+        txt_path = os.path.join(text_folder, filename)
+        sections_path = os.path.join(
+            sections_folder, filename[: -len(".txt")] + ".json"
+        )
+
+        index = read_index(sections_path)
+        if index is not None and same_file(index, txt_path):
+            continue
+
+        # Read as TextParser.read_text does, the offsets index that text
+        with open(txt_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        source_hash = hash_text(text)
+
+        # The hash catches files copied in with an old mtime, and a touched
+        # file that didn't change only gets its size and mtime updated
+        if index is None or index["sha256"] != source_hash:
+            index = {"sha256": source_hash, "sections": segment(text)}
+            segmented += 1
+        stat = os.stat(txt_path)
+        index.update(length=len(text), size=stat.st_size, mtime=stat.st_mtime_ns)
+
+        tmp_path = f"{sections_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, sections_path)
+
+    return segmented
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the section index")
+    parser.add_argument("text_folder", help="folder with the <Log#>.txt files")
+    parser.add_argument("sections_folder", help="output folder")
+    args = parser.parse_args()
+
+    count = build_section_index(args.text_folder, args.sections_folder)
+    print(f"Segmented {count} reports into {args.sections_folder}")
@@ -0,0 +1,90 @@
+"""
+This script gives lazy access to the stop lists of name_stops.py. Parsing
+that 220 KB module is only needed to (re)build name_stops.json, a compact
+copy of the lists that loads in a couple of milliseconds. The JSON records
+the hash of name_stops.py, so editing the lists rebuilds it on next use.
+Nothing is read until a list is first used.
+
+Rebuild the JSON by hand with:
+
+    python stop_lists.py
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+SOURCE_PATH = os.path.join(FOLDER, "name_stops.py")
+STOP_LISTS_PATH = os.path.join(FOLDER, "name_stops.json")
+NAMES = ["STREET_STOPS", "SUFFIX_STOPS", "NAME_STOPS", "DIGRAPH_STOPS"]
+
+_stop_lists = None
+
+
+def hash_source(source_path=SOURCE_PATH):
+    with open(source_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build(source_path=SOURCE_PATH, stop_lists_path=STOP_LISTS_PATH):
+    """Writes the lists of name_stops.py into the JSON file and returns them"""
+    import name_stops
+
+    stop_lists = {name: getattr(name_stops, name) for name in NAMES}
+    data = {"source_sha256": hash_source(source_path), "stop_lists": stop_lists}
+
+    # Pool workers may rebuild it at the same time, so each one writes its
+    # own temporary file and the last os.replace wins
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(stop_lists_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, stop_lists_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return stop_lists
+
+
+def load_stop_lists():
+    """Returns a dict with every stop list, loaded once per process"""
+    global _stop_lists
+    if _stop_lists is not None:
+        return _stop_lists
+
+    if os.path.exists(STOP_LISTS_PATH):
+        with open(STOP_LISTS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data["source_sha256"] == hash_source():
+            _stop_lists = data["stop_lists"]
+            return _stop_lists
+
+    try:
+        _stop_lists = build()
+    except OSError:
+        # Read-only checkout, use the module directly
+        import name_stops
+
+        _stop_lists = {name: getattr(name_stops, name) for name in NAMES}
+    return _stop_lists
+
+
+class LazyStopList:
+    """Class attribute that loads its stop list on first access"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        return load_stop_lists()[self.name]
+
+
+if __name__ == "__main__":
+    stop_lists = build()
+    for name, stops in stop_lists.items():
+        print(f"{name}: {len(stops)} words")
+    print(f"Stop lists written to {STOP_LISTS_PATH}")
@@ -8,7 +8,8 @@ and it will return the corresponding summary.
 Author: Federico Dominguez Molina
 """
 
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from model_registry import get_model
+from sections import extract_sections
 
 
 class Summarizer:
@@ -19,13 +20,25 @@ class Summarizer:
 
     BART_INPUT_SIZE = 1024
 
-    def __init__(self, model_name: str, complaint_text: str, input_size: int = 2048):
+    def __init__(
+        self,
+        model_name: str,
+        complaint_text: str,
+        input_size: int = 2048,
+        sections: list = None,
+    ):
+        # With sections (e.g. ["allegations", "conclusion"]), complaint_text
+        # must be the raw text of the report, and only those sections are
+        # summarized instead of the truncated whole report
+        if sections is not None:
+            complaint_text = extract_sections(complaint_text, sections)
+
         self.model_name = model_name
         self.complaint_text = complaint_text
         self.input_size = input_size
 
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Loaded once per process and shared by every Summarizer(model_name)
+        self.model, self.tokenizer = get_model("seq2seq", model_name)
 
         if self.model_name == "facebook/bart-large-cnn":
             self.inputs = self.tokenizer(
@@ -8,25 +8,21 @@ if required, stemming and lemmatization procedures.
 Authors: Federico Dominguez, Matt Jackson and Jonathan Juarez
 """
 
+import io
+import multiprocessing
 import os
 import re
 import datetime
 
-import nltk
-
-nltk.download(
-    "stopwords"
-)  # https://www.machinelearningplus.com/nlp/lemmatization-examples-python/
-nltk.download("wordnet")
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from nltk.stem.snowball import (
-    SnowballStemmer,
-)  # https://www.geeksforgeeks.org/snowball-stemmer-nlp/
-
 # CONSTANTS
 
-from name_stops import STREET_STOPS, SUFFIX_STOPS, NAME_STOPS, DIGRAPH_STOPS
+import nltk_resources
+from stop_lists import LazyStopList
+from corpus_store import CorpusStore
+from text_cleaner import TextCleaner
+from word_normalizer import NormalizerCache, get_normalizer
+from preprocessed_cache import PreprocessedCache, fingerprint, hash_text
+from sections import extract_sections, load_sections
 
 CHARS_TO_REMOVE = ["\n", "§"]
 REGEX_PATTERNS = [
@@ -119,6 +115,20 @@ FINDING_STOPS = ["sustained", "not sustained", "unfounded", "exonerated"]
 
 # TODO: consider "TWO-LETTER-STOPS = every digraph from 'abcdefghijklmnopqrstuvwxyz'"
 
+# Files per task sent to the get_full_corpus workers
+CHUNK_SIZE = 32
+
+
+def get_clean_fingerprint(cleaner):
+    """Fingerprint of the cleaning of file_to_string (lowercased text)"""
+    return fingerprint(
+        {
+            "regex_patterns": cleaner.regex_patterns,
+            "chars_to_remove": cleaner.chars_to_remove,
+            "lower_text": True,
+        }
+    )
+
 
 class TextParser:
     CHARS_TO_REMOVE = CHARS_TO_REMOVE
@@ -127,10 +137,11 @@ class TextParser:
     CUSTOM_STOPS = CUSTOM_STOPS
     FINDING_STOPS = FINDING_STOPS
 
-    STREET_STOPS = STREET_STOPS
-    SUFFIX_STOPS = SUFFIX_STOPS
-    NAME_STOPS = NAME_STOPS
-    DIGRAPH_STOPS = DIGRAPH_STOPS
+    # Loaded from name_stops.json on first access, see stop_lists.py
+    STREET_STOPS = LazyStopList()
+    SUFFIX_STOPS = LazyStopList()
+    NAME_STOPS = LazyStopList()
+    DIGRAPH_STOPS = LazyStopList()
 
     def __init__(
         self,
@@ -140,20 +151,68 @@ class TextParser:
         findings_are_stops=False,
         names_are_stops=False,
         digraphs_are_stops=False,
+        corpus_store=None,
+        normalizer_cache=None,
+        preprocessed_cache=None,
+        skip_list=None,
+        sections_folder=None,
     ):
         # Path should be the folder where the .txt files are located
         self.path = path
+
+        # Optional CorpusStore (or its path) to read the reports from
+        # instead of the .txt files, see corpus_store.py
+        if isinstance(corpus_store, str):
+            corpus_store = CorpusStore(corpus_store)
+        self.corpus_store = corpus_store
+
+        # Log#s left out of the corpus, e.g. the near-duplicates found by
+        # dedup.py; a path to its CSV or any collection of Log#s
+        if isinstance(skip_list, str):
+            from dedup import load_skip_list
+
+            skip_list = load_skip_list(skip_list)
+        self.skip_list = set(skip_list or [])
+
+        # Optional folder with the section index of every report, built by
+        # sections.py; without it, reports are segmented when needed
+        self.sections_folder = sections_folder
+
+        # CHARS_TO_REMOVE and REGEX_PATTERNS compiled once, see text_cleaner.py
+        self.cleaner = TextCleaner(self.CHARS_TO_REMOVE, self.REGEX_PATTERNS)
+        self.clean_fingerprint = get_clean_fingerprint(self.cleaner)
+
+        # Stems and lemmas are computed once per word, normalizer_cache is
+        # an optional SQLite file to share them across runs and processes
+        self.stem_cache = NormalizerCache("stem", path=normalizer_cache)
+        self.lemma_cache = NormalizerCache("lemmatize", path=normalizer_cache)
+
+        # Optional SQLite file where process_file keeps every preprocessed
+        # report, see preprocessed_cache.py
+        self.preprocessed_cache = (
+            PreprocessedCache(preprocessed_cache)
+            if preprocessed_cache is not None
+            else None
+        )
+        self._fingerprints = {}
+
+        self.stemmer = get_normalizer("stem")
+        self.lemmatizer = get_normalizer("lemmatize")
         self.nlp_task = nlp_task
         self.add_custom_stops = add_custom_stops
         self.findings_are_stops = findings_are_stops
         self.names_are_stops = names_are_stops
         self.digraphs_are_stops = digraphs_are_stops
 
+        # The NLTK data is checked (and downloaded if missing) on first use
+        # instead of on import
+        # https://www.machinelearningplus.com/nlp/lemmatization-examples-python/
+        nltk_resources.require("stopwords")
+        from nltk.corpus import stopwords
+
         if nlp_task == "topic modeling":
 
             print("Initializing parsers for topic modeling...")
-            self.stemmer = SnowballStemmer(language="english")
-            self.lemmatizer = WordNetLemmatizer()
             self.stops = list(stopwords.words("english"))
 
             if self.add_custom_stops:
@@ -173,58 +232,98 @@ class TextParser:
             self.stops = list(stopwords.words("english"))  # default stops go here
             # instead of being set in preprocess()
 
+        # With names_are_stops the list has tens of thousands of words, a set
+        # makes every lookup in preprocess constant time
+        self.stop_set = frozenset(self.stops)
+
+    def get_log_number(self, filename):
+        return filename[: -len(".txt")] if filename.endswith(".txt") else filename
+
+    def in_store(self, filename):
+        return (
+            self.corpus_store is not None
+            and self.get_log_number(filename) in self.corpus_store
+        )
+
+    def read_text(self, filename):
+        """
+        Returns the raw text of a report, from the corpus store if it holds
+        the report, otherwise from its .txt file
+        """
+        if self.in_store(filename):
+            return self.corpus_store.get(self.get_log_number(filename), "raw")
+
+        file_path = os.path.join(self.path, filename)
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+
     def txt_to_list(self, filename):
         """
         Add each line of a text file to a list
         """
 
-        file_path = os.path.join(self.path, filename)
         lines = []
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip().split()
-                lines.append(line)
+        for line in io.StringIO(self.read_text(filename)):
+            line = line.strip().split()
+            lines.append(line)
 
         return lines
 
-    def file_to_string(self, filename, lower_text=True):
+    def read_sections(self, filename, sections, fallback=True):
+        """
+        Returns the raw text of the given sections of a report (e.g.
+        ["allegations", "conclusion"]), see sections.py. If none of them is
+        found, the whole text is returned unless fallback is False.
+        """
+        text = self.read_text(filename)
+        index = None
+        if self.sections_folder is not None:
+            # A report read from the corpus store has no .txt file to check
+            txt_path = None
+            if not self.in_store(filename):
+                txt_path = os.path.join(self.path, filename)
+            index = load_sections(
+                self.get_log_number(filename), self.sections_folder, text, txt_path
+            )
+        return extract_sections(text, sections, index, fallback)
+
+    def file_to_string(self, filename, lower_text=True, sections=None):
         """
         Add each line of a text file to a string, text is
-        lowercased by default
+        lowercased by default. With sections, only those sections of the
+        report are kept (see read_sections)
         """
-        text = ""
-        file_path = os.path.join(self.path, filename)
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                for char in self.CHARS_TO_REMOVE:
-                    line = line.replace(char, "")
-                text += line
-
-        text = text.strip()
-        if lower_text:
-            text = text.lower()
-        text = re.sub(r"\s+", " ", text)
-
-        # Remove REGEX patterns
-        for pattern in self.REGEX_PATTERNS:
-            text = re.sub(pattern, "", text, flags=re.IGNORECASE)
-        return text
+        if sections is not None:
+            text = self.read_sections(filename, sections)
+            return self.clean_text(text, lower_text=lower_text)
+
+        # The corpus store keeps the cleaned (lowercased) text ready, unless
+        # it was cleaned with other REGEX_PATTERNS or CHARS_TO_REMOVE
+        if (
+            lower_text
+            and self.in_store(filename)
+            and self.corpus_store.clean_fingerprint == self.clean_fingerprint
+        ):
+            log_number = self.get_log_number(filename)
+            if "clean" in self.corpus_store.documents[log_number]:
+                return self.corpus_store.get(log_number, "clean")
+
+        return self.clean_text(self.read_text(filename), lower_text=lower_text)
+
+    def clean_text(self, text: str, lower_text=True):
+        """
+        Applies the same cleaning as 'file_to_string' to a raw text,
+        including the removal of CHARS_TO_REMOVE
+        """
+        text = self.cleaner.remove_chars(text)
+        return self.process_given_text(text, lower_text=lower_text)
 
     def process_given_text(self, text: str, lower_text=True):
         """
         Applies the preprocessing steps to from 'file_to_string'
         to a given text
         """
-
-        text = text.strip()
-        if lower_text:
-            text = text.lower()
-        text = re.sub(r"\s+", " ", text)
-
-        # Remove REGEX patterns
-        for pattern in self.REGEX_PATTERNS:
-            text = re.sub(pattern, "", text, flags=re.IGNORECASE)
-        return text
+        return self.cleaner.clean(text, lower_text=lower_text)
 
     def preprocess(
         self,
@@ -245,21 +344,149 @@ class TextParser:
 
         data = data.split(" ")
         if remove_stops:
-            # self.stops = list(stopwords.words("english")) #added
-            # ^ this would override all the added stops. instead declare in __init__
-            data = [w for w in data if w not in self.stops]
+            # The stops are declared in __init__
+            stop_set = self.stop_set
+            data = [w for w in data if w not in stop_set]
             if stem:
-                self.stemmer = SnowballStemmer(language="english")
-                data = [self.stemmer.stem(w) for w in data]
+                data = self.stem_cache.normalize_all(data)
             elif lemmatize:
                 # doing both stem and lemmatize seems no different than lemmatize-only
-                self.lemmatizer = WordNetLemmatizer()
-                data = [self.lemmatizer.lemmatize(w) for w in data]
+                data = self.lemma_cache.normalize_all(data)
         if return_as_list:
             return [w for w in data if w != ""]
         else:
             return " ".join(data)
 
+    def get_filenames(self):
+        """Returns the .txt files of the corpus, sorted by name"""
+        if self.corpus_store is not None:
+            filenames = [f"{log}.txt" for log in self.corpus_store.log_numbers]
+        else:
+            filenames = sorted(f for f in os.listdir(self.path) if f.endswith(".txt"))
+        if self.skip_list:
+            filenames = [
+                f for f in filenames if self.get_log_number(f) not in self.skip_list
+            ]
+        return filenames
+
+    def get_fingerprint(self, options):
+        """
+        Fingerprint of everything that changes the output of process_file
+        for the given options: the stop words, the normalizers, HEADERS,
+        REGEX_PATTERNS and CHARS_TO_REMOVE
+        """
+        key = tuple(sorted(options.items()))
+        if key not in self._fingerprints:
+            self._fingerprints[key] = fingerprint(
+                {
+                    "options": options,
+                    "stops": self.stops,
+                    "normalizers": [self.stem_cache.key, self.lemma_cache.key],
+                    "headers": [HEADERS.pattern, HEADERS.flags],
+                    "regex_patterns": self.REGEX_PATTERNS,
+                    "chars_to_remove": self.CHARS_TO_REMOVE,
+                }
+            )
+        return self._fingerprints[key]
+
+    def process_file(
+        self,
+        filename,
+        preprocess_input=True,
+        remove_stops=True,
+        stem_input=False,
+        lemmatize_input=False,
+        return_as_list=False,
+    ):
+        """
+        Reads a report and preprocesses it as in 'get_full_corpus'. With a
+        preprocessed_cache, reports whose text did not change since they
+        were preprocessed with the same settings are read from the cache.
+        """
+        data = self.read_text(filename)
+        if self.preprocessed_cache is None or not preprocess_input:
+            return self._process_text(
+                data,
+                preprocess_input,
+                remove_stops,
+                stem_input,
+                lemmatize_input,
+                return_as_list,
+            )
+
+        settings_fingerprint = self.get_fingerprint(
+            {
+                "remove_stops": remove_stops,
+                "stem_input": stem_input,
+                "lemmatize_input": lemmatize_input,
+                "return_as_list": return_as_list,
+            }
+        )
+        log_number = self.get_log_number(filename)
+        source_hash = hash_text(data)
+
+        result = self.preprocessed_cache.get(
+            settings_fingerprint, log_number, source_hash
+        )
+        if result is None:
+            result = self._process_text(
+                data,
+                preprocess_input,
+                remove_stops,
+                stem_input,
+                lemmatize_input,
+                return_as_list,
+            )
+            self.preprocessed_cache.put(
+                settings_fingerprint, log_number, source_hash, result
+            )
+        return result
+
+    def _process_text(
+        self,
+        data,
+        preprocess_input,
+        remove_stops,
+        stem_input,
+        lemmatize_input,
+        return_as_list,
+    ):
+        data = re.sub("\n", " ", data)
+        if preprocess_input:
+            return self.preprocess(
+                data,
+                remove_stops=remove_stops,
+                stem=stem_input,
+                lemmatize=lemmatize_input,
+                return_as_list=return_as_list,
+            )
+        return data.split() if return_as_list else data
+
+    def iter_corpus(
+        self,
+        preprocess_input=True,
+        remove_stops=True,
+        stem_input=False,
+        lemmatize_input=False,
+        return_as_list=True,
+        with_log_numbers=True,
+    ):
+        """
+        Returns a CorpusStream over the reports, which yields
+        (log_number, tokens) (or the text, with return_as_list=False) one
+        report at a time instead of holding the whole corpus in memory.
+        It can be iterated several times, e.g. by gensim, and always goes
+        through the same reports in file name order.
+        """
+        options = {
+            "preprocess_input": preprocess_input,
+            "remove_stops": remove_stops,
+            "stem_input": stem_input,
+            "lemmatize_input": lemmatize_input,
+            "return_as_list": return_as_list,
+        }
+        return CorpusStream(self, self.get_filenames(), options, with_log_numbers)
+
     def get_full_corpus(
         self,
         preprocess_input=True,
@@ -269,31 +496,40 @@ class TextParser:
         print_progress=False,
         write_to_file=False,
         write_path="../../corpora/",
+        workers=1,
+        chunk_size=CHUNK_SIZE,
     ):
         """
-        Extract text from every .txt file in a folder.
+        Extract text from every .txt file in a folder, in file name order.
+        With workers > 1 the files are preprocessed in a process pool, in
+        chunks of chunk_size files.
         Returns (list): a corpus, with each document's text as a single
         long string
         """
         corpus = []
-
-        for i, filename in enumerate(os.listdir(self.path)):
-            if print_progress and i % 100 == 0:
-                print(f"Extracting text from file {i}...")
-            if filename.endswith(".txt"):
-                filepath = os.path.join(self.path, filename)
-                with open(filepath, "r") as f:
-                    data = "".join(f.readlines())
-                data = re.sub("\n", " ", data)
-                if preprocess_input:
-                    data = self.preprocess(
-                        data,
-                        remove_stops=remove_stops,
-                        stem=stem_input,
-                        lemmatize=lemmatize_input,
-                        return_as_list=False,
+        filenames = self.get_filenames()
+        options = {
+            "preprocess_input": preprocess_input,
+            "remove_stops": remove_stops,
+            "stem_input": stem_input,
+            "lemmatize_input": lemmatize_input,
+        }
+
+        if workers > 1:
+            for chunk in map_chunks(
+                self, _process_chunk, filenames, (options,), workers, chunk_size
+            ):
+                corpus.extend(chunk)
+                if print_progress:
+                    print(
+                        f"Extracted text from {len(corpus)} "
+                        f"of {len(filenames)} files..."
                     )
-                corpus.append(data)
+        else:
+            for i, filename in enumerate(filenames):
+                if print_progress and i % 100 == 0:
+                    print(f"Extracting text from file {i}...")
+                corpus.append(self.process_file(filename, **options))
 
         if print_progress:
             print("Corpus text extraction complete")
@@ -337,3 +573,65 @@ class TextParser:
                 print("Corpus written to file")
 
         return corpus
+
+
+class CorpusStream:
+    """
+    Re-iterable corpus built by TextParser.iter_corpus. The list of files
+    is taken when it is created, so every pass sees the same reports.
+    """
+
+    def __init__(self, parser, filenames, options, with_log_numbers=True):
+        self.parser = parser
+        self.filenames = filenames
+        self.options = options
+        self.with_log_numbers = with_log_numbers
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __iter__(self):
+        for filename in self.filenames:
+            data = self.parser.process_file(filename, **self.options)
+            if self.with_log_numbers:
+                yield self.parser.get_log_number(filename), data
+            else:
+                yield data
+
+
+# The TextParser of each map_chunks worker process
+_worker_parser = None
+
+
+def _init_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def get_worker_parser():
+    """Returns the TextParser of the current map_chunks worker process"""
+    return _worker_parser
+
+
+def map_chunks(parser, function, filenames, args=(), workers=2, chunk_size=CHUNK_SIZE):
+    """
+    Calls function((chunk, *args)) for every chunk of chunk_size files in a
+    process pool and yields the results in order. function must be defined
+    at module level and read the parser with get_worker_parser(): each
+    worker unpickles the parser, stops and stemmers only once.
+    """
+    chunks = [
+        (filenames[i : i + chunk_size], *args)
+        for i in range(0, len(filenames), chunk_size)
+    ]
+    with multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(parser,)
+    ) as pool:
+        # imap returns the chunks in order
+        yield from pool.imap(function, chunks)
+
+
+def _process_chunk(args):
+    filenames, options = args
+    parser = get_worker_parser()
+    return [parser.process_file(filename, **options) for filename in filenames]
@@ -0,0 +1,154 @@
+"""
+This script contains the stemming and lemmatization used by TextParser.
+The corpus has far fewer distinct words than tokens, so every word is
+stemmed (or lemmatized) once: results are kept in a bounded in-memory LRU
+and, optionally, in a SQLite table that is shared by every run and every
+worker process pointing to the same file.
+"""
+
+import os
+import sqlite3
+from collections import OrderedDict
+from importlib import metadata
+
+import nltk_resources
+
+# Words kept in memory per normalizer
+CACHE_SIZE = 200_000
+
+# SQLite limits the number of parameters of a query
+SQLITE_BATCH = 500
+
+# One stemmer and one lemmatizer per process
+_normalizers = {}
+
+
+def get_normalizer(kind):
+    """Returns the shared SnowballStemmer ("stem") or WordNetLemmatizer ("lemmatize")"""
+    # NLTK is slow to import, only load it when a normalizer is needed
+    if kind not in _normalizers:
+        if kind == "stem":
+            from nltk.stem.snowball import SnowballStemmer
+
+            _normalizers[kind] = SnowballStemmer(language="english")
+        elif kind == "lemmatize":
+            from nltk.stem import WordNetLemmatizer
+
+            _normalizers[kind] = WordNetLemmatizer()
+        else:
+            raise ValueError(f"Unknown normalizer {kind}, choose stem or lemmatize")
+    return _normalizers[kind]
+
+
+class NormalizerCache:
+    """
+    Memoizes a normalizer by word. With a path, results are also read from
+    and written to a SQLite table, keyed by the normalizer and the NLTK
+    version so an upgrade doesn't reuse stale results.
+    """
+
+    def __init__(self, kind, maxsize=CACHE_SIZE, path=None):
+        normalizer = get_normalizer(kind)
+        self.kind = kind
+        self.function = normalizer.stem if kind == "stem" else normalizer.lemmatize
+        self.key = f"{kind}:{metadata.version('nltk')}"
+        self.maxsize = maxsize
+        self.path = path
+        self.memo = OrderedDict()
+
+        # Number of words that actually went through the normalizer
+        self.calls = 0
+
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # SQLite connections can't be pickled or shared with child processes
+        state = self.__dict__.copy()
+        del state["function"]
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        normalizer = get_normalizer(self.kind)
+        self.function = normalizer.stem if self.kind == "stem" else normalizer.lemmatize
+
+    def connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS normalized ("
+                "normalizer TEXT, word TEXT, result TEXT, "
+                "PRIMARY KEY (normalizer, word))"
+            )
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def lookup(self, words):
+        """Returns the results stored on disk for the given words"""
+        connection = self.connect()
+        found = {}
+        for i in range(0, len(words), SQLITE_BATCH):
+            batch = words[i : i + SQLITE_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(
+                "SELECT word, result FROM normalized "
+                f"WHERE normalizer = ? AND word IN ({placeholders})",
+                [self.key, *batch],
+            )
+            found.update(rows)
+        return found
+
+    def store(self, results):
+        connection = self.connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO normalized VALUES (?, ?, ?)",
+                [(self.key, word, result) for word, result in results.items()],
+            )
+
+    def normalize_all(self, words):
+        """Returns the normalized version of every word in the list"""
+        memo = self.memo
+        results = {}
+        missing = []
+        for word in dict.fromkeys(words):
+            if word in memo:
+                memo.move_to_end(word)
+                results[word] = memo[word]
+            else:
+                missing.append(word)
+
+        if missing:
+            found = self.lookup(missing) if self.path is not None else {}
+            if self.kind == "lemmatize":
+                nltk_resources.require("wordnet")
+            computed = {
+                word: self.function(word) for word in missing if word not in found
+            }
+            self.calls += len(computed)
+            if computed and self.path is not None:
+                self.store(computed)
+
+            found.update(computed)
+            results.update(found)
+            memo.update(found)
+            while len(memo) > self.maxsize:
+                memo.popitem(last=False)
+
+        return [results[w] for w in words]
+
+    def normalize(self, word):
+        return self.normalize_all([word])[0]
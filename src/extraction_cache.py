@@ -0,0 +1,105 @@
+"""
+This script contains an on-disk, content-addressed cache for the text
+extracted from the PDFs. Entries are keyed by the SHA-256 of the PDF plus
+the name and version of the extractor, so an unchanged report is never
+extracted twice and upgrading or switching a backend invalidates the cache.
+
+The cache also keeps a small index of (size, mtime) -> SHA-256 per file so
+re-runs don't even need to re-hash the PDFs that were not touched.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path):
+    """Computes the SHA-256 of a file without loading it in memory"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_atomic(file_path, data):
+    """Writes a file through a temporary file so readers never see half of it"""
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ExtractionCache:
+    """
+    Stores the extracted pages of every PDF as
+    <path>/<hash[:2]>/<hash>.<extractor>.<version>.json
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hash_index_path = os.path.join(self.path, "hash_index.json")
+        self.hash_index = {}
+
+        if os.path.exists(self.hash_index_path):
+            with open(self.hash_index_path, "r", encoding="utf-8") as f:
+                self.hash_index = json.load(f)
+
+    def get_entry_path(self, content_hash, extractor_name, extractor_version):
+        # Keep the file name safe whatever the backend names and versions are
+        extractor = re.sub(r"[^\w.+-]", "_", f"{extractor_name}.{extractor_version}")
+        return os.path.join(
+            self.path, content_hash[:2], f"{content_hash}.{extractor}.json"
+        )
+
+    def get(self, content_hash, extractor_name, extractor_version):
+        """Returns the cached pages of a PDF, or None on a miss"""
+        entry_path = self.get_entry_path(
+            content_hash, extractor_name, extractor_version
+        )
+        if not os.path.exists(entry_path):
+            return None
+
+        with open(entry_path, "r", encoding="utf-8") as f:
+            return json.load(f)["pages"]
+
+    def put(self, content_hash, extractor_name, extractor_version, pages):
+        entry_path = self.get_entry_path(
+            content_hash, extractor_name, extractor_version
+        )
+        write_atomic(entry_path, json.dumps({"pages": pages}))
+
+    def known_hash(self, file_path):
+        """
+        Returns the hash recorded for a file if its size and modification
+        time did not change since, None otherwise
+        """
+        stat = os.stat(file_path)
+        entry = self.hash_index.get(os.path.basename(file_path))
+        if entry is None:
+            return None
+        if entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+            return None
+        return entry["sha256"]
+
+    def record_hash(self, file_path, content_hash):
+        stat = os.stat(file_path)
+        self.hash_index[os.path.basename(file_path)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "sha256": content_hash,
+        }
+
+    def save_hash_index(self):
+        write_atomic(self.hash_index_path, json.dumps(self.hash_index, indent=1))
@@ -0,0 +1,277 @@
+"""
+This script contains the PDF text extraction backends used by
+text_extractor.py. PyPDF2 missed the text of around 30 reports, so every
+backend exposes the same small interface and FallbackExtractor combines
+them: pages are extracted with the fastest backend available and only the
+pages that come back empty (or nearly) are retried with the next one.
+
+Backends are optional, install the ones you want to use:
+
+    pip install PyPDF2 pypdfium2 PyMuPDF pdfplumber
+"""
+
+import time
+from importlib import metadata
+
+# Pages with fewer characters than this are retried with the next backend
+MIN_PAGE_CHARS = 20
+
+# Pages held back (from the first weak one) to retry their weak pages in a
+# single call per backend, which bounds the memory used on large PDFs
+RETRY_BATCH = 16
+
+
+class Backend:
+    """
+    Every backend implements iter_pages, which yields the text of the given
+    pages (all pages by default) lazily, keeping the document open
+    """
+
+    name = None
+    package = None
+
+    def iter_pages(self, pdf_file_path, page_numbers=None):
+        raise NotImplementedError
+
+    def extract_pages(self, pdf_file_path, page_numbers=None):
+        """Returns the text of the given pages (all pages by default)"""
+        return list(self.iter_pages(pdf_file_path, page_numbers))
+
+
+class PyPDF2Backend(Backend):
+    name = "pypdf2"
+    package = "PyPDF2"
+
+    def __init__(self):
+        import PyPDF2
+
+        self.PyPDF2 = PyPDF2
+
+    def iter_pages(self, pdf_file_path, page_numbers=None):
+        with open(pdf_file_path, "rb") as file:
+            reader = self.PyPDF2.PdfReader(file)
+            if page_numbers is None:
+                page_numbers = range(len(reader.pages))
+            for i in page_numbers:
+                yield reader.pages[i].extract_text()
+
+
+class PdfiumBackend(Backend):
+    name = "pypdfium2"
+    package = "pypdfium2"
+
+    def __init__(self):
+        import pypdfium2
+
+        self.pdfium = pypdfium2
+
+    def iter_pages(self, pdf_file_path, page_numbers=None):
+        pdf = self.pdfium.PdfDocument(pdf_file_path)
+        try:
+            if page_numbers is None:
+                page_numbers = range(len(pdf))
+            for i in page_numbers:
+                page = pdf[i]
+                textpage = page.get_textpage()
+                # pdfium returns Windows line endings
+                text = textpage.get_text_range().replace("\r\n", "\n")
+                textpage.close()
+                page.close()
+                yield text
+        finally:
+            pdf.close()
+
+
+class PyMuPDFBackend(Backend):
+    name = "pymupdf"
+    package = "PyMuPDF"
+
+    def __init__(self):
+        import fitz
+
+        self.fitz = fitz
+
+    def iter_pages(self, pdf_file_path, page_numbers=None):
+        with self.fitz.open(pdf_file_path) as reader:
+            if page_numbers is None:
+                page_numbers = range(reader.page_count)
+            for i in page_numbers:
+                yield reader.load_page(i).get_text()
+
+
+class PdfPlumberBackend(Backend):
+    name = "pdfplumber"
+    package = "pdfplumber"
+
+    def __init__(self):
+        import pdfplumber
+
+        self.pdfplumber = pdfplumber
+
+    def iter_pages(self, pdf_file_path, page_numbers=None):
+        with self.pdfplumber.open(pdf_file_path) as pdf:
+            if page_numbers is None:
+                page_numbers = range(len(pdf.pages))
+            for i in page_numbers:
+                yield pdf.pages[i].extract_text() or ""
+
+
+# From fastest to slowest
+BACKENDS = {
+    backend.name: backend
+    for backend in [PyMuPDFBackend, PdfiumBackend, PyPDF2Backend, PdfPlumberBackend]
+}
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, choose one of {list(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def get_backend_version(backend):
+    try:
+        return metadata.version(backend.package)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def available_backends(names=None):
+    """Instantiates the requested backends (all by default) that are installed"""
+    backends = []
+    for name in names or BACKENDS:
+        try:
+            backends.append(get_backend(name))
+        except ImportError:
+            pass
+    return backends
+
+
+class FallbackExtractor:
+    """
+    Extracts every page with the first backend and retries the pages that
+    come back with less than min_chars characters with the next backends,
+    keeping the longest text found for each page.
+    """
+
+    def __init__(self, backends=None, min_chars=MIN_PAGE_CHARS):
+        self.backends = available_backends(backends)
+        if not self.backends:
+            raise ImportError("None of the PDF extraction backends is installed")
+        self.min_chars = min_chars
+
+    @property
+    def name(self):
+        return "+".join(backend.name for backend in self.backends)
+
+    @property
+    def version(self):
+        return "+".join(get_backend_version(backend) for backend in self.backends)
+
+    def iter_pages(self, pdf_file_path):
+        """
+        Yields the text of every page of the PDF as soon as it is extracted.
+        If the first backend cannot open the PDF at all, the next one is used.
+        From a weak page on, up to RETRY_BATCH pages are held back so their
+        weak pages are retried together, with one call per next backend.
+        """
+        errors = []
+        for n, backend in enumerate(self.backends):
+            pages_yielded = 0
+            # Pages held back, starting with a weak one
+            first_page = 0
+            held = []
+            try:
+                for i, text in enumerate(backend.iter_pages(pdf_file_path)):
+                    text = text or ""
+                    if not held and not self.is_weak(text):
+                        yield text
+                        pages_yielded += 1
+                        continue
+                    if not held:
+                        first_page = i
+                    held.append(text)
+                    if len(held) == RETRY_BATCH:
+                        held = self.retry_pages(
+                            pdf_file_path, first_page, held, self.backends[n + 1 :]
+                        )
+                        yield from held
+                        pages_yielded += len(held)
+                        held = []
+                if held:
+                    yield from self.retry_pages(
+                        pdf_file_path, first_page, held, self.backends[n + 1 :]
+                    )
+                return
+            except Exception as e:
+                if pages_yielded:
+                    raise
+                errors.append(f"{backend.name}: {e}")
+
+        raise ValueError("; ".join(errors))
+
+    def is_weak(self, text):
+        return len(text.strip()) < self.min_chars
+
+    def retry_pages(self, pdf_file_path, first_page, texts, backends):
+        """
+        Retries the weak pages among texts, the pages from first_page on,
+        with the given backends. Each backend extracts all the pages still
+        weak in a single call; the longest text found for each page is kept.
+        """
+        texts = list(texts)
+        for backend in backends:
+            weak = [i for i, text in enumerate(texts) if self.is_weak(text)]
+            if not weak:
+                break
+            try:
+                retries = backend.extract_pages(
+                    pdf_file_path, [first_page + i for i in weak]
+                )
+            except Exception:
+                continue
+            for i, retry in zip(weak, retries):
+                if retry and len(retry.strip()) > len(texts[i].strip()):
+                    texts[i] = retry
+        return texts
+
+    def extract_pages(self, pdf_file_path):
+        """Returns the text of every page of the PDF"""
+        return list(self.iter_pages(pdf_file_path))
+
+
+def benchmark(pdf_file_paths, backends=None):
+    """
+    Extracts the given PDFs with every backend and returns, per backend,
+    the pages per second, the characters recovered and the empty pages
+    """
+    results = {}
+    for backend in available_backends(backends):
+        pages = 0
+        chars = 0
+        empty_pages = 0
+        failures = 0
+
+        start = time.perf_counter()
+        for pdf_file_path in pdf_file_paths:
+            try:
+                texts = backend.extract_pages(pdf_file_path)
+            except Exception:
+                failures += 1
+                continue
+            pages += len(texts)
+            chars += sum(len(text.strip()) for text in texts)
+            empty_pages += sum(len(text.strip()) < MIN_PAGE_CHARS for text in texts)
+        elapsed = time.perf_counter() - start
+
+        results[backend.name] = {
+            "version": get_backend_version(backend),
+            "seconds": round(elapsed, 3),
+            "pages": pages,
+            "pages_per_second": round(pages / elapsed, 2) if elapsed else None,
+            "chars": chars,
+            "empty_pages": empty_pages,
+            "failures": failures,
+        }
+
+    return results
@@ -1,114 +1,471 @@
-"""This script extracts the files from all PDFs by using the
-PyPDF2 library and stores the extracted text in a CSV file.
+"""This script extracts the text from all PDFs and writes one .txt file per
+log report. The fastest installed backend is used and pages that come back
+empty are retried with the next one (see pdf_backends.py).
+
+Pages are streamed straight into each report's .txt file, together with a
+page index (page number -> character range in the .txt file) stored in
+page_offsets/. The text_data.csv file with every report is only written
+when requested with --csv.
 
 Author: Jonathan Juarez
 """
 
+import argparse
 import csv
+import json
+import multiprocessing
 import os
+import signal
+import time
 
 import pandas as pd
-import PyPDF2
 from constants import repo_root
+from extraction_cache import ExtractionCache, hash_file, write_atomic
+from pdf_backends import BACKENDS, FallbackExtractor, benchmark
 
 # set path to local directory
 path = repo_root / "data/pdfs"
-pdf_files = [file for file in os.listdir(path) if file.endswith(".pdf")]
-
-if pdf_files:
-    print(f"Total PDF files found in the specified path: {len(pdf_files)}")
-else:
-    print("No PDF files found in the specified path.")
+cache_path = path / "extraction_cache"
+text_path = path / "text_files"
+offsets_path = path / "page_offsets"
+
+# Seconds a single PDF may take before it is reported as failed
+TIMEOUT = 300
+
+# Extra seconds the main process waits for a worker before replacing it,
+# so the worker's own SIGALRM can report the timeout first
+TIMEOUT_GRACE = 5
 
+# Seconds between checks on the PDFs being extracted
+POLL_INTERVAL = 0.1
+
+# One extractor per process and backend list, and one cache per process
+# and path, built on first use
+_extractors = {}
+_caches = {}
 
-def extract_text_from_pdf(pdf_file_path):
-    with open(pdf_file_path, "rb") as file:
-        reader = PyPDF2.PdfReader(file)
-        num_pages = len(reader.pages)
 
-        # Extract text from each page
-        text_data = ""
-        for page_num in range(num_pages):
-            page = reader.pages[page_num]
-            text_data += page.extract_text()
+def get_extractor(backends=None):
+    key = tuple(backends) if backends else None
+    if key not in _extractors:
+        _extractors[key] = FallbackExtractor(backends)
+    return _extractors[key]
 
-        # Clean up the text to remove special characters (if needed)
-        # text_data = re.sub(r'[^\w\s]', '', text_data)
 
-        return text_data
+def get_cache(cache_path):
+    if cache_path not in _caches:
+        _caches[cache_path] = ExtractionCache(cache_path)
+    return _caches[cache_path]
 
 
-def process_all_pdfs(directory_path, output_csv_path):
-    pdf_files = [file for file in os.listdir(directory_path) if file.endswith(".pdf")]
+def normalize_newlines(text):
+    """The page offsets are only valid if nobody translates newlines on read"""
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def iter_pages_cached(pdf_file_path, backends=None, cache=None, content_hash=None):
+    """
+    Returns (pages, content_hash, from_cache). The pages are looked up in
+    the cache by the hash of the PDF and the extractor name and version.
+    On a miss, pages is a generator that extracts the pages lazily and
+    stores them in the cache once the last one was extracted.
+    """
+    extractor = get_extractor(backends)
+    if cache is None:
+        return extractor.iter_pages(pdf_file_path), content_hash, False
+
+    if content_hash is None:
+        content_hash = hash_file(pdf_file_path)
+
+    pages = cache.get(content_hash, extractor.name, extractor.version)
+    if pages is not None:
+        return pages, content_hash, True
+
+    def extract_and_store():
+        pages = []
+        for text in extractor.iter_pages(pdf_file_path):
+            pages.append(text)
+            yield text
+        cache.put(content_hash, extractor.name, extractor.version, pages)
+
+    return extract_and_store(), content_hash, False
+
+
+def extract_text_from_pdf(pdf_file_path, backends=None, cache=None):
+    pages, _, _ = iter_pages_cached(pdf_file_path, backends, cache)
+    text_data = "".join(pages)
+
+    # Clean up the text to remove special characters (if needed)
+    # text_data = re.sub(r'[^\w\s]', '', text_data)
+
+    return text_data
+
+
+def write_document(pages, txt_file_path, offsets_file_path):
+    """
+    Streams the pages of a report into its .txt file and writes the page
+    index, a list of [start, end) character ranges, one per page.
+    Returns the number of characters written.
+    """
+    offsets = []
+    position = 0
+    tmp_path = f"{txt_file_path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as txt_file:
+            for text in pages:
+                text = normalize_newlines(text)
+                txt_file.write(text)
+                offsets.append([position, position + len(text)])
+                position += len(text)
+        os.replace(tmp_path, txt_file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    write_atomic(offsets_file_path, json.dumps(offsets))
+    return position
+
+
+def is_unchanged(txt_file_path, offsets_file_path, pages):
+    """Checks if a report's .txt file and page index already hold the pages"""
+    if not os.path.exists(txt_file_path) or not os.path.exists(offsets_file_path):
+        return False
+    with open(txt_file_path, "r", encoding="utf-8", newline="") as txt_file:
+        return txt_file.read() == "".join(normalize_newlines(text) for text in pages)
+
+
+def load_page_offsets(log_number, offsets_folder=offsets_path):
+    """Returns the [start, end) character range of every page of a report"""
+    with open(os.path.join(offsets_folder, f"{log_number}.json"), "r") as f:
+        return json.load(f)
+
+
+class ExtractionTimeout(BaseException):
+    # Not an Exception, so the backends' error handling can't swallow it
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+
+def extract_worker(job):
+    """
+    Extracts a single PDF into its .txt file and page index. Returns a dict
+    with the log number, error, content hash, whether it came from the
+    cache and, if job["return_text"], the text itself.
+    Runs in the worker processes. SIGALRM (Unix only) interrupts a PDF
+    stuck in Python code; run_jobs also stops the ones stuck in a
+    backend's C code, which never see the alarm.
+    """
+    pdf_file_path = job["pdf_file_path"]
+    timeout = job["timeout"]
+    cache = get_cache(job["cache_path"]) if job["cache_path"] is not None else None
+    log_number = os.path.basename(pdf_file_path).replace(".pdf", "")
+    txt_file_path = os.path.join(job["output_folder"], f"{log_number}.txt")
+    offsets_file_path = os.path.join(job["offsets_folder"], f"{log_number}.json")
+
+    result = {
+        "log_number": log_number,
+        "error": None,
+        "content_hash": job["content_hash"],
+        "from_cache": False,
+        "text": None,
+    }
+
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(timeout)
+
+    try:
+        pages, result["content_hash"], result["from_cache"] = iter_pages_cached(
+            pdf_file_path, job["backends"], cache, job["content_hash"]
+        )
+        # Reports served from the cache are only rewritten if they changed
+        if not (
+            result["from_cache"]
+            and is_unchanged(txt_file_path, offsets_file_path, pages)
+        ):
+            write_document(pages, txt_file_path, offsets_file_path)
+
+        if job["return_text"]:
+            with open(txt_file_path, "r", encoding="utf-8", newline="") as txt_file:
+                result["text"] = txt_file.read()
+    except ExtractionTimeout:
+        result["error"] = f"Timed out after {timeout} seconds"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+    return result
+
+
+def failed_result(job, error):
+    """Result of a PDF whose worker crashed or had to be stopped"""
+    log_number = os.path.basename(job["pdf_file_path"]).replace(".pdf", "")
+    return {
+        "log_number": log_number,
+        "error": error,
+        "content_hash": job["content_hash"],
+        "from_cache": False,
+        "text": None,
+    }
+
+
+def remove_partial_outputs(job):
+    """
+    Removes the temporary files that killed workers left in the output,
+    page index and cache folders of the job. Only safe while no worker is
+    writing to them.
+    """
+    folders = [job["output_folder"], job["offsets_folder"]]
+    if job["cache_path"] is not None:
+        folders += [folder for folder, _, _ in os.walk(job["cache_path"])]
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(folder, name))
+
+
+def run_jobs(jobs, workers):
+    """
+    Runs extract_worker over the jobs in a pool of processes and yields the
+    results in the order of the jobs. At most one job per worker is in
+    flight, so a job starts as soon as it is submitted. A job that doesn't
+    finish in its timeout (plus TIMEOUT_GRACE) is reported as timed out and
+    the pool is replaced, which kills its worker; the partial outputs of the
+    killed workers are removed and the other jobs in flight are started
+    again in the new pool.
+    """
+    pool = multiprocessing.Pool(workers)
+    # job index -> (AsyncResult, start time)
+    running = {}
+    finished = {}
+    next_job = 0
+    next_result = 0
+
+    try:
+        while next_result < len(jobs):
+            while next_job < len(jobs) and len(running) < workers:
+                running[next_job] = (
+                    pool.apply_async(extract_worker, (jobs[next_job],)),
+                    time.monotonic(),
+                )
+                next_job += 1
+
+            # Wait for the oldest job, at most POLL_INTERVAL
+            oldest = min(running)
+            running[oldest][0].wait(POLL_INTERVAL)
+
+            now = time.monotonic()
+            stuck = []
+            for index, (async_result, start) in list(running.items()):
+                if async_result.ready():
+                    try:
+                        finished[index] = async_result.get()
+                    except Exception as e:
+                        finished[index] = failed_result(
+                            jobs[index], f"{type(e).__name__}: {e}"
+                        )
+                    del running[index]
+                elif (
+                    jobs[index]["timeout"]
+                    and now - start > jobs[index]["timeout"] + TIMEOUT_GRACE
+                ):
+                    stuck.append(index)
+
+            if stuck:
+                for index in stuck:
+                    finished[index] = failed_result(
+                        jobs[index], f"Timed out after {jobs[index]['timeout']} seconds"
+                    )
+                    del running[index]
+                pool.terminate()
+                pool.join()
+                remove_partial_outputs(jobs[0])
+                pool = multiprocessing.Pool(workers)
+                for index in running:
+                    running[index] = (
+                        pool.apply_async(extract_worker, (jobs[index],)),
+                        time.monotonic(),
+                    )
+
+            while next_result in finished:
+                yield finished.pop(next_result)
+                next_result += 1
+    finally:
+        pool.terminate()
+        pool.join()
+        if running:
+            # The loop ended early and the jobs in flight were killed
+            remove_partial_outputs(jobs[0])
+
+
+def process_all_pdfs(
+    directory_path,
+    output_folder,
+    offsets_folder,
+    workers=1,
+    timeout=TIMEOUT,
+    backends=None,
+    cache_path=None,
+    output_csv_path=None,
+):
+    """
+    Extracts the text of every PDF in the directory into one .txt file per
+    report, plus its page index. With workers > 1 the PDFs are spread over
+    a process pool. The PDFs that failed or timed out are listed in
+    extraction_failures.csv, next to the PDFs. With a cache_path, PDFs whose
+    content did not change are served from the extraction cache. If an
+    output_csv_path is given, the texts are also written there in Log# order.
+    """
+    pdf_files = sorted(
+        file for file in os.listdir(directory_path) if file.endswith(".pdf")
+    )
 
     if not pdf_files:
         print("No PDF files found in the specified directory.")
         return
 
-    with open(output_csv_path, "w", newline="", encoding="utf-8") as csv_file:
+    print(f"Total PDF files found in the specified path: {len(pdf_files)}")
+    os.makedirs(output_folder, exist_ok=True)
+    os.makedirs(offsets_folder, exist_ok=True)
+
+    cache = ExtractionCache(cache_path) if cache_path is not None else None
+    jobs = []
+    for file in pdf_files:
+        pdf_file_path = os.path.join(directory_path, file)
+        jobs.append(
+            {
+                "pdf_file_path": pdf_file_path,
+                "timeout": timeout,
+                "backends": backends,
+                "cache_path": cache_path,
+                # Skip re-hashing the PDFs that were not touched since the last run
+                "content_hash": cache.known_hash(pdf_file_path) if cache else None,
+                "output_folder": str(output_folder),
+                "offsets_folder": str(offsets_folder),
+                "return_text": output_csv_path is not None,
+            }
+        )
+
+    failures = []
+    from_cache_count = 0
+    total_pdfs_processed = 0
+
+    csv_file = None
+    if output_csv_path is not None:
+        csv_file = open(output_csv_path, "w", newline="", encoding="utf-8")
         csv_writer = csv.writer(csv_file)
         csv_writer.writerow(["Log#", "Text"])
 
-        total_pdfs_processed = 0
-
-        for pdf_file in pdf_files:
-            log_number = pdf_file.replace(".pdf", "")
-            pdf_file_path = os.path.join(directory_path, pdf_file)
-            text_data = extract_text_from_pdf(pdf_file_path)
-            csv_writer.writerow([log_number, text_data])
+    # A PDF stuck in a backend's C code can only be stopped from another
+    # process, so with a timeout even a single worker runs in a pool
+    use_pool = workers > 1 or bool(timeout)
+    results = run_jobs(jobs, workers) if use_pool else map(extract_worker, jobs)
 
+    try:
+        for job, result in zip(jobs, results):
+            log_number = result["log_number"]
             total_pdfs_processed += 1
 
-            # print progress after processing each PDF
-            print(log_number)
-            print(f"PDFs processed: {total_pdfs_processed}")
-
-
-# This attempts to extract text from all pds, then stores it into text_data.csv
-directory_path = "/data/pdfs"
-output_csv_path = f"{directory_path}/text_data.csv"
-
-process_all_pdfs(path, output_csv_path)
-
-# try using other extractor libraries as the above didn't work to extract all text
-# text from 30 reports missing
+            if cache is not None and result["content_hash"] is not None:
+                cache.record_hash(job["pdf_file_path"], result["content_hash"])
 
-# pip install pdfplumber PyMuPDF PyPDFium
+            if result["error"] is not None:
+                print(f"Error extracting {log_number}: {result['error']}")
+                failures.append((log_number, result["error"]))
+                continue
 
-# import fitz  # PyMuPDF
+            if csv_file is not None:
+                csv_writer.writerow([log_number, result["text"]])
+            from_cache_count += result["from_cache"]
 
-# def extract_text_from_pdf(pdf_file_path):
-#     try:
-#         with open(pdf_file_path, 'rb') as file:
-#             # Use PyMuPDF (MuPDF)
-#             reader = fitz.open(file)
-#             num_pages = reader.page_count
-#             text_data = ""
-
-#             for page_num in range(num_pages):
-#                 page = reader.load_page(page_num)
-#                 text_data += page.get_text()
-
-#             # Clean up the text if needed
-#             # text_data = re.sub(r'[^\w\s]', '', text_data)
-
-#             return text_data
-#     except Exception as e:
-#         print(f"Error extracting text from {pdf_file_path}: {e}")
-#         return ""
-
-
-# create txt files for each extracted log report
-df = pd.read_csv(output_csv_path)
-output_folder = path / "text_files"
-os.makedirs(output_folder, exist_ok=True)
-
-for index, row in df.iterrows():
-    log_number = str(row["Log#"])
-    text_data = str(row["Text"])
-
-    filename = os.path.join(output_folder, f"{log_number}.txt")
-
-    # Save the text as a .txt file
-    with open(filename, "w", encoding="utf-8") as txt_file:
-        txt_file.write(text_data)
+            # print progress after processing each PDF
+            print(log_number)
+            print(f"PDFs processed: {total_pdfs_processed}")
+    finally:
+        if use_pool:
+            # Stops the workers if the loop ended early
+            results.close()
+        if csv_file is not None:
+            csv_file.close()
+        if cache is not None:
+            cache.save_hash_index()
+
+    if cache is not None:
+        print(f"{from_cache_count} of {total_pdfs_processed} PDFs served from cache")
+
+    failures_path = os.path.join(directory_path, "extraction_failures.csv")
+    if failures:
+        pd.DataFrame(failures, columns=["Log#", "Error"]).to_csv(
+            failures_path, index=False
+        )
+        print(f"{len(failures)} PDFs failed, see {failures_path}")
+    elif os.path.exists(failures_path):
+        # Don't leave the failures of a previous run behind
+        os.remove(failures_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the text of the PDFs")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes used to extract the PDFs",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=TIMEOUT,
+        help="seconds before a single PDF is reported as failed",
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(BACKENDS),
+        help="extraction backends in fallback order (default: all installed)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="extract every PDF again instead of using the extraction cache",
+    )
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="also write every report into text_data.csv",
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        metavar="N",
+        help="report pages/sec and characters per backend on N PDFs and exit",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        pdf_files = sorted(file for file in os.listdir(path) if file.endswith(".pdf"))
+        pdf_file_paths = [os.path.join(path, file) for file in pdf_files]
+        results = benchmark(pdf_file_paths[: args.benchmark], args.backends)
+        print(pd.DataFrame(results).T.to_string())
+        raise SystemExit(0)
+
+    # This extracts the text from all pdfs into text_files/ and page_offsets/
+    process_all_pdfs(
+        path,
+        text_path,
+        offsets_path,
+        workers=args.workers,
+        timeout=args.timeout,
+        backends=args.backends,
+        cache_path=None if args.no_cache else str(cache_path),
+        output_csv_path=path / "text_data.csv" if args.csv else None,
+    )
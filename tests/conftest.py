@@ -0,0 +1,12 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules import their siblings by name, as when run from their folder
+for folder in (
+    "src",
+    os.path.join("src", "exploratory"),
+    os.path.join("src", "copa_scraper"),
+):
+    sys.path.insert(0, os.path.join(ROOT, folder))
@@ -0,0 +1,60 @@
+import pytest
+from corpus_store import CorpusStore
+from text_parser import TextParser
+
+REPORT = "CIVILIAN OFFICE OF POLICE ACCOUNTABILITY\nLog# 1087654\nThe officer used a taser."
+
+
+@pytest.fixture
+def text_folder(tmp_path):
+    folder = tmp_path / "text_files"
+    folder.mkdir()
+    (folder / "1087654.txt").write_text(REPORT, encoding="utf-8")
+    return str(folder)
+
+
+def build_store(tmp_path, text_folder, clean_fingerprint):
+    # A marker instead of the cleaned text shows where the text came from
+    return CorpusStore.build(
+        str(tmp_path / "corpus"),
+        text_folder,
+        clean_fn=lambda raw: "stored clean text",
+        clean_fingerprint=clean_fingerprint,
+    )
+
+
+def test_clean_text_is_read_from_a_matching_store(tmp_path, text_folder):
+    parser = TextParser(text_folder, nlp_task="summarization")
+    store = build_store(tmp_path, text_folder, parser.clean_fingerprint)
+    parser = TextParser(text_folder, nlp_task="summarization", corpus_store=store)
+
+    assert parser.file_to_string("1087654.txt") == "stored clean text"
+
+
+@pytest.mark.parametrize("clean_fingerprint", [None, "built with other patterns"])
+def test_outdated_clean_text_is_recomputed(tmp_path, text_folder, clean_fingerprint):
+    store = build_store(tmp_path, text_folder, clean_fingerprint)
+    parser = TextParser(text_folder, nlp_task="summarization", corpus_store=store)
+    expected = parser.clean_text(REPORT)
+
+    assert expected != "stored clean text"
+    assert parser.file_to_string("1087654.txt") == expected
+
+
+def test_fingerprint_follows_the_patterns(text_folder):
+    class OtherParser(TextParser):
+        REGEX_PATTERNS = TextParser.REGEX_PATTERNS + [r"taser"]
+
+    parser = TextParser(text_folder, nlp_task="summarization")
+    other = OtherParser(text_folder, nlp_task="summarization")
+    assert parser.clean_fingerprint != other.clean_fingerprint
+
+
+def test_iter_batches_reads_only_the_given_reports(tmp_path, text_folder):
+    store = build_store(tmp_path, text_folder, None)
+    assert list(store.iter_batches()) == [[("1087654", REPORT)]]
+    assert list(store.iter_batches(log_numbers=["1087654"])) == [
+        [("1087654", REPORT)]
+    ]
+    # Nothing to read is not the whole corpus
+    assert list(store.iter_batches(log_numbers=[])) == []
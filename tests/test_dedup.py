@@ -0,0 +1,65 @@
+import numpy as np
+
+from dedup import MinHashLSH, find_duplicates, load_skip_list, write_skip_list
+from text_parser import TextParser
+
+REPORT = " ".join(
+    f"the officer {verb} the complainant near the {place} on day {day}"
+    for day, (verb, place) in enumerate(
+        [
+            ("stopped", "vehicle"),
+            ("searched", "alley"),
+            ("pushed", "store"),
+            ("questioned", "station"),
+            ("released", "park"),
+            ("handcuffed", "corner"),
+        ]
+        * 3
+    )
+)
+OTHER = " ".join(f"word{i} token{i * 7} item{i * 13}" for i in range(60))
+
+
+def write_reports(folder, reports):
+    for log_number, text in reports.items():
+        (folder / f"{log_number}.txt").write_text(text, encoding="utf-8")
+
+
+def test_duplicates_are_skipped_from_the_corpus(tmp_path):
+    write_reports(
+        tmp_path,
+        {
+            "1000001": REPORT,
+            # Amended version, posted again: the longest one is kept
+            "1000002": REPORT + " the report was amended",
+            "1000003": REPORT,
+            "1000004": OTHER,
+        },
+    )
+    parser = TextParser(str(tmp_path), nlp_task="summarization")
+
+    clusters = find_duplicates(parser)
+    assert len(clusters) == 1
+    assert clusters[0]["keep"] == "1000002"
+    assert [log for log, _ in clusters[0]["duplicates"]] == ["1000001", "1000003"]
+    assert all(similarity >= 0.8 for _, similarity in clusters[0]["duplicates"])
+
+    skip_list_path = str(tmp_path / "duplicates.csv")
+    write_skip_list(clusters, skip_list_path)
+    assert load_skip_list(skip_list_path) == {"1000001", "1000003"}
+
+    parser = TextParser(
+        str(tmp_path), nlp_task="summarization", skip_list=skip_list_path
+    )
+    assert parser.get_filenames() == ["1000002.txt", "1000004.txt"]
+
+
+def test_large_buckets_are_skipped():
+    lsh = MinHashLSH(num_perm=8, bands=2)
+    hashes = np.arange(10, dtype=np.uint64)
+    for i in range(5):
+        lsh.add(i, hashes)
+    lsh.add(5, np.arange(100, 110, dtype=np.uint64))
+
+    assert list(lsh.candidate_buckets(max_size=None)) == [[0, 1, 2, 3, 4]] * 2
+    assert list(lsh.candidate_buckets(max_size=4)) == []
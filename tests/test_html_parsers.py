@@ -0,0 +1,80 @@
+import os
+
+import pytest
+import pandas as pd
+from html_parsers import BeautifulSoupParser, get_parser
+
+pytest.importorskip("lxml")
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_page(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+def check_parity(portal_pages=(), case_pages=(), backend="lxml"):
+    """
+    Compares the output of a backend against the original one on the given
+    page contents. Returns a list with the description of every mismatch.
+    """
+    reference = BeautifulSoupParser()
+    candidate = get_parser(backend)
+    mismatches = []
+
+    for i, content in enumerate(portal_pages):
+        expected = reference.parse_table(content)
+        try:
+            pd.testing.assert_frame_equal(candidate.parse_table(content), expected)
+        except AssertionError as e:
+            mismatches.append(f"portal page {i}: table differs\n{e}")
+
+        if reference.get_last_page(content) != candidate.get_last_page(content):
+            mismatches.append(f"portal page {i}: last page differs")
+
+    for i, content in enumerate(case_pages):
+        if reference.find_pdf_url(content) != candidate.find_pdf_url(content):
+            mismatches.append(f"case page {i}: PDF url differs")
+
+    return mismatches
+
+
+def test_lxml_matches_read_html_on_portal_pages():
+    portal = read_page("portal_page.html")
+    case = read_page("case_page.html")
+    assert check_parity([portal], [case], backend="lxml") == []
+
+
+def test_spanned_cells_are_expanded():
+    table = get_parser("lxml").parse_table(read_page("portal_page.html"))
+
+    assert len(table) == 4
+    # colspan="2" fills the Transparency Release and Closed dates
+    assert table.loc[1, "Transparency Release Date"] == "08/29/2023"
+    assert table.loc[1, "Closed Date"] == "08/29/2023"
+    # rowspan="2" carries the district down to the next case
+    assert table.loc[3, "District of Occurrence"] == "25"
+    assert table.loc[3, "COPA Notification Date"] == "10/20/2021"
+    assert table["FSR/Memo Posted Date"].isna().tolist() == [False, True, False, True]
+
+
+@pytest.mark.parametrize("backend", ["html.parser", "lxml"])
+def test_pages(backend):
+    parser = get_parser(backend)
+    assert parser.get_last_page(read_page("portal_page.html")) == 1277
+    assert parser.find_pdf_url(read_page("case_page.html")) == (
+        "https://www.chicagocopa.org/wp-content/uploads/2024/01/2019-0003826-FSR.pdf"
+    )
+
+
+def test_tables_without_thead():
+    page = (
+        b"<table><tr><th>Log#</th><th>Count</th><th>Count</th></tr>"
+        b"<tr><td>2019-0003826</td><td>1,234</td><td>True</td></tr>"
+        b"<tr><td colspan='3'></td></tr></table>"
+    )
+    expected = BeautifulSoupParser().parse_table(page)
+    result = get_parser("lxml").parse_table(page)
+    assert list(result.columns) == ["Log#", "Count", "Count.1"]
+    assert result.equals(expected)
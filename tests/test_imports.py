@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import stop_lists
+from import_benchmark import FOLDER
+
+# Modules that take seconds to import or load data, only needed on first use
+HEAVY_MODULES = ["nltk", "transformers", "torch", "spacy", "name_stops"]
+
+SCRIPT = (
+    "import json, sys\n"
+    "import {module}\n"
+    "print(json.dumps(sorted(sys.modules)))\n"
+)
+
+
+@pytest.mark.parametrize(
+    "module", ["text_parser", "ner_extractor", "summarizer_model", "helper_functions"]
+)
+def test_import_loads_no_heavy_module(module):
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(module=module)],
+        cwd=FOLDER,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = json.loads(output.stdout.strip().splitlines()[-1])
+    heavy = [name for name in imported if name.split(".")[0] in HEAVY_MODULES]
+    assert heavy == []
+
+
+def test_concurrent_builds_dont_share_a_temporary_file(tmp_path):
+    path = str(tmp_path / "name_stops.json")
+    with ThreadPoolExecutor(4) as executor:
+        results = list(
+            executor.map(lambda _: stop_lists.build(stop_lists_path=path), range(8))
+        )
+
+    assert all(result == results[0] for result in results)
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f)["stop_lists"] == results[0]
+    assert os.listdir(tmp_path) == ["name_stops.json"]
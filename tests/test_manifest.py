@@ -0,0 +1,40 @@
+import json
+import os
+
+from manifest import ScrapeManifest
+
+
+def test_cases_are_logged_and_compacted_on_close(tmp_path):
+    path = str(tmp_path / "scrape_manifest.json")
+    with ScrapeManifest(path) as manifest:
+        for i in range(3):
+            manifest.record(f"2019-000000{i}", "08/29/2023", f"https://fsr/{i}.pdf")
+        # The manifest itself is not rewritten after every case
+        assert not os.path.exists(path)
+        with open(manifest.log_path, "r", encoding="utf-8") as f:
+            assert len(f.readlines()) == 3
+
+    assert not os.path.exists(f"{path}.log")
+    with open(path, "r", encoding="utf-8") as f:
+        assert len(json.load(f)) == 3
+    assert ScrapeManifest(path).is_done("2019-0000002", " 08/29/2023 ")
+
+
+def test_crashed_run_is_recovered_from_the_log(tmp_path):
+    path = str(tmp_path / "scrape_manifest.json")
+    with ScrapeManifest(path) as manifest:
+        manifest.record("2019-0000001", "08/29/2023", "https://fsr/1.pdf")
+
+    # A run that crashed without closing, in the middle of a line
+    manifest = ScrapeManifest(path)
+    manifest.record("2019-0000002", "08/30/2023", "https://fsr/2.pdf")
+    manifest.record("2019-0000001", "09/01/2023", "https://fsr/1b.pdf")
+    manifest._log.write('["2019-0000003", {"posted_da')
+    manifest._log.flush()
+
+    recovered = ScrapeManifest(path)
+    assert not os.path.exists(f"{path}.log")
+    assert recovered.is_done("2019-0000002", "08/30/2023")
+    assert recovered.get("2019-0000001")["pdf_url"] == "https://fsr/1b.pdf"
+    assert recovered.get("2019-0000003") is None
+    manifest.close()
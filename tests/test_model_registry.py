@@ -0,0 +1,65 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import helper_functions
+import model_registry
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Replaces the loaders with a slow fake one, returns the names it loaded"""
+    loaded = []
+
+    def load_fake(name, **options):
+        loaded.append(name)
+        time.sleep(0.2)
+        return SimpleNamespace(name=name)
+
+    for kind in model_registry.LOADERS:
+        monkeypatch.setitem(model_registry.LOADERS, kind, load_fake)
+    model_registry.clear()
+    yield loaded
+    model_registry.clear()
+
+
+def get_in_threads(names):
+    models = {}
+
+    def get(i, name):
+        models[i] = model_registry.get_model("ner", name)
+
+    threads = [
+        threading.Thread(target=get, args=(i, name)) for i, name in enumerate(names)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [models[i] for i in range(len(names))]
+
+
+def test_same_model_is_loaded_once(loads):
+    models = get_in_threads(["bert"] * 4)
+    assert loads == ["bert"]
+    assert all(model is models[0] for model in models)
+    assert model_registry.get_metrics()[0]["hits"] == 3
+
+
+def test_different_models_load_in_parallel(loads):
+    start = time.perf_counter()
+    get_in_threads(["bert", "bart", "roberta"])
+    assert sorted(loads) == ["bart", "bert", "roberta"]
+    # Loaded one after the other, it would take at least 0.6 seconds
+    assert time.perf_counter() - start < 0.5
+
+
+def test_helper_functions_share_the_registry(loads):
+    docs = [SimpleNamespace(ents=[SimpleNamespace(text="Chicago", label_="GPE")])]
+    nlp = model_registry.get_model("spacy", "en_core_web_sm")
+    nlp.pipe = lambda texts, batch_size: docs
+
+    assert helper_functions.extract_entities_spacy(["text"]) == {"Chicago"}
+    assert loads == ["en_core_web_sm"]
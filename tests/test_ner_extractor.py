@@ -0,0 +1,400 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ner_extractor
+from ner_extractor import ExtractEntities, Window, shift_entities, split_windows
+
+# (entity, label, count, report_number), with a "##" piece at the start of
+# a report, I- labels after O and at the start of a report, and a B- run
+# that a new report must end
+ROWS = [
+    ("Officer", "B-PER", 1, "1001"),
+    ("Sm", "I-PER", 2, "1001"),
+    ("##ith", "I-PER", 1, "1001"),
+    ("at", "O", 1, "1001"),
+    ("Chicago", "B-LOC", 3, "1001"),
+    ("Police", "I-ORG", 1, "1001"),
+    ("##ks", "I-ORG", 1, "1002"),
+    ("Doe", "I-PER", 1, "1002"),
+    ("said", "O", 2, "1002"),
+    ("Jane", "I-PER", 1, "1002"),
+    ("Ro", "I-PER", 1, "1002"),
+    ("##e", "I-PER", 1, "1002"),
+    ("CO", "B-ORG", 1, "1002"),
+    ("##PA", "B-ORG", 2, "1002"),
+    ("Ken", "I-PER", 1, "1003"),
+    ("##wood", "I-LOC", 1, "1003"),
+    ("in", "O", 1, "1003"),
+    ("Chicago", "B-LOC", 1, "1003"),
+]
+
+
+def reference_aggregate_subwords(entities):
+    """The previous ExtractEntities.aggregate_subwords, for a single report"""
+    corrected_entities = []
+    previous_entity = ""
+    previous_label = ""
+    previous_count = 0
+
+    for entity, label, count in entities:
+        if entity.startswith("##"):
+            if previous_entity:
+                previous_entity += entity[2:]
+                previous_count += count
+        else:
+            if previous_entity:
+                corrected_entities.append(
+                    (previous_entity, previous_label, previous_count)
+                )
+            previous_entity = entity
+            previous_label = label
+            previous_count = count
+
+    if previous_entity:
+        corrected_entities.append((previous_entity, previous_label, previous_count))
+
+    return corrected_entities
+
+
+def reference_aggregate_entities(df):
+    """The previous iterrows implementation of aggregate_entities"""
+    aggregated_entities = []
+    current_entity = ""
+    current_label = ""
+    report_number = ""
+
+    for i, row in df.iterrows():
+        if "B-" in row["label"]:
+            if current_entity:
+                aggregated_entities.append(
+                    {
+                        "entity": current_entity,
+                        "label": current_label,
+                        "report_number": report_number,
+                    }
+                )
+            current_entity = row["entity"]
+            current_label = row["label"].split("-")[1]
+            report_number = row["report_number"]
+        elif "I-" in row["label"]:
+            current_entity += f" {row['entity']}"
+        else:
+            if current_entity:
+                aggregated_entities.append(
+                    {
+                        "entity": current_entity,
+                        "label": current_label,
+                        "report_number": report_number,
+                    }
+                )
+                current_entity = ""
+                current_label = ""
+                report_number = ""
+
+    if current_entity:
+        aggregated_entities.append(
+            {
+                "entity": current_entity,
+                "label": current_label,
+                "report_number": report_number,
+            }
+        )
+
+    return pd.DataFrame(aggregated_entities)
+
+
+@pytest.fixture
+def entities():
+    return pd.DataFrame(ROWS, columns=["entity", "label", "count", "report_number"])
+
+
+def test_merge_subwords_matches_the_previous_loop(entities):
+    expected = []
+    for report_number, report in entities.groupby("report_number", sort=False):
+        rows = report[["entity", "label", "count"]].itertuples(index=False)
+        for entity, label, count in reference_aggregate_subwords(rows):
+            expected.append((entity, label, count, report_number))
+    expected = pd.DataFrame(expected, columns=entities.columns)
+
+    merged = ner_extractor.merge_subwords(entities)
+    pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+    # The "##ks" piece opening report 1002 has no entity to join
+    assert "Policeks" not in merged["entity"].tolist()
+
+
+def test_aggregate_entities_matches_the_previous_loop(entities):
+    # The previous loop ran over a single report, and appended an I- label
+    # with no run to continue to an empty entity with no label: that I-
+    # now opens an entity, like a B- label
+    expected = []
+    for _, report in entities.groupby("report_number", sort=False):
+        report = report.copy()
+        previous = report["label"].shift(fill_value="O")
+        opens = report["label"].str.startswith("I-") & (previous == "O")
+        report.loc[opens, "label"] = "B-" + report.loc[opens, "label"].str[2:]
+        expected.append(reference_aggregate_entities(report))
+    expected = pd.concat(expected, ignore_index=True)
+
+    aggregated = ner_extractor.aggregate_entities(entities)
+    assert isinstance(aggregated["label"].dtype, pd.CategoricalDtype)
+    assert isinstance(aggregated["report_number"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(
+        aggregated.astype(object), expected.astype(object), check_dtype=False
+    )
+    # Runs end with their report, not on a change of type
+    assert aggregated["entity"].tolist()[:3] == [
+        "Officer Sm ##ith",
+        "Chicago Police",
+        "##ks Doe",
+    ]
+
+
+def test_missing_values_dont_read_other_rows():
+    df = pd.DataFrame(
+        {
+            "entity": ["John", np.nan, "Doe", "said", "Zed"],
+            "label": ["B-PER", "I-PER", np.nan, "B-PER", "O"],
+            "report_number": [np.nan, np.nan, np.nan, "1002", "1002"],
+        }
+    )
+
+    aggregated = ner_extractor.aggregate_entities(df)
+    assert aggregated["entity"].tolist() == ["John ", "said"]
+    assert aggregated["label"].tolist() == ["PER", "PER"]
+
+    merged = ner_extractor.merge_subwords(df)
+    # The rows with no report number are a single report
+    assert merged["entity"].tolist() == ["John", "", "Doe", "said", "Zed"]
+
+
+TEXT = (
+    "Officer Washington stopped Jonathan Richardson on Halsted Street. "
+    "The complainant said Sergeant Kowalski and Officer Delgado searched "
+    "the vehicle while Detective Montgomery watched from Chicago Avenue. "
+    "Witnesses named Lieutenant Abernathy, who denied the allegations."
+)
+
+
+class FakeTokenizer:
+    """Splits words in pieces of at most 4 characters, like "##" subwords"""
+
+    def pieces(self, text):
+        for match in re.finditer(r"\w+|[^\w\s]", text):
+            for start in range(match.start(), match.end(), 4):
+                yield start, min(start + 4, match.end()), start > match.start()
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        return {"offset_mapping": [(start, end) for start, end, _ in self.pieces(text)]}
+
+
+class FakePipeline:
+    """Tags every piece of a capitalized word as PER"""
+
+    def __init__(self):
+        self.tokenizer = FakeTokenizer()
+        self.calls = []
+
+    def __call__(self, texts, batch_size=1):
+        self.calls.append(texts)
+        outputs = []
+        for text in texts:
+            entities = []
+            for index, (start, end, is_subword) in enumerate(
+                self.tokenizer.pieces(text), start=1
+            ):
+                word_start = start
+                while word_start and text[word_start - 1].isalnum():
+                    word_start -= 1
+                if text[word_start].isupper():
+                    entities.append(
+                        {
+                            "word": "##" * is_subword + text[start:end],
+                            "entity": "B-PER" if not is_subword else "I-PER",
+                            "start": start,
+                            "end": end,
+                            "index": index,
+                        }
+                    )
+            outputs.append(entities)
+        return outputs
+
+
+@pytest.fixture
+def make_extractor(monkeypatch):
+    monkeypatch.setattr(ner_extractor, "get_model", lambda kind, name: FakePipeline())
+    return lambda **kwargs: ExtractEntities(model="fake", **kwargs)
+
+
+def test_windows_respect_window_size_and_stride():
+    text = " ".join(str(i % 10) for i in range(40))
+    offsets = FakeTokenizer()(text)["offset_mapping"]
+    windows = split_windows(offsets, window_size=8, stride=3)
+
+    assert windows[0].token_start == 0
+    assert windows[-1].token_start + windows[-1].n_tokens == len(offsets)
+    for window in windows:
+        assert window.n_tokens == 8 or window is windows[-1]
+        assert window.start == offsets[window.token_start][0]
+        assert window.end == offsets[window.token_start + window.n_tokens - 1][1]
+    for previous, window in zip(windows, windows[1:]):
+        assert previous.token_start + previous.n_tokens - window.token_start == 3
+
+    with pytest.raises(ValueError):
+        split_windows(offsets, window_size=8, stride=8)
+
+
+def test_windows_keep_words_whole_and_own_the_text_once():
+    offsets = FakeTokenizer()(TEXT)["offset_mapping"]
+    windows = split_windows(offsets, window_size=8, stride=3)
+    assert len(windows) > 5
+
+    word_starts = {start for start, _ in offsets[:1]} | {
+        start for (_, end), (start, _) in zip(offsets, offsets[1:]) if start != end
+    }
+    word_ends = {end for _, end in offsets[-1:]} | {
+        end for (_, end), (start, _) in zip(offsets, offsets[1:]) if start != end
+    }
+    for window in windows:
+        assert window.n_tokens <= 8
+        assert window.start in word_starts
+        assert window.end in word_ends
+        assert window.start <= window.owned_start < window.owned_end <= window.end
+
+    # The owned ranges follow each other from the start to the end of the text
+    assert windows[0].owned_start == 0
+    assert windows[-1].owned_end == len(TEXT)
+    for previous, window in zip(windows, windows[1:]):
+        assert previous.owned_end == window.owned_start
+
+
+def test_shift_entities_keeps_the_owned_entities():
+    window = Window(
+        token_start=5, n_tokens=8, start=20, end=60, owned_start=30, owned_end=50
+    )
+    entities = [
+        {"word": "A", "entity": "B-PER", "start": 5, "end": 6, "index": 1},
+        {"word": "B", "entity": "B-PER", "start": 10, "end": 12, "index": 3},
+        {"word": "C", "entity": "B-PER", "start": 29, "end": 31, "index": 7},
+        {"word": "D", "entity": "B-PER", "start": 30, "end": 32, "index": 8},
+    ]
+    assert shift_entities(entities, window) == [
+        {"word": "B", "entity": "B-PER", "start": 30, "end": 32, "index": 8},
+        {"word": "C", "entity": "B-PER", "start": 49, "end": 51, "index": 12},
+    ]
+
+
+def test_windowed_entities_match_a_single_window(make_extractor):
+    whole = make_extractor()
+    expected = whole.find_entities(TEXT)
+    assert len(whole.nlp.calls) == 1
+
+    windowed = make_extractor(window_size=8, stride=3)
+    entities = windowed.find_entities(TEXT)
+    assert len(windowed.nlp.calls) > 1
+    assert entities == expected
+
+    for entity in entities:
+        assert TEXT[entity["start"] : entity["end"]] == entity["word"].lstrip("#")
+    # Entities seen by two windows are kept once, from their owner
+    windows = windowed.get_windows(TEXT)
+    straddling = [
+        entity
+        for entity in entities
+        for previous, window in zip(windows, windows[1:])
+        if window.start <= entity["start"] and entity["end"] <= previous.end
+    ]
+    assert straddling
+    assert len({entity["start"] for entity in entities}) == len(entities)
+
+
+def test_run_windows_yields_each_text_once(make_extractor):
+    extractor = make_extractor(window_size=8, stride=3)
+    texts = [TEXT, "", "Officer Delgado", TEXT[:100]]
+
+    completed = {}
+    tokens = 0
+    for done, batch_tokens in extractor.run_windows(texts, batch_size=2):
+        for i, entities in done:
+            assert i not in completed
+            completed[i] = entities
+        tokens += batch_tokens
+
+    assert sorted(completed) == [0, 1, 2, 3]
+    assert completed[1] == []
+    assert all(len(batch) <= 2 for batch in extractor.nlp.calls)
+    windows = [window for text in texts for window in extractor.get_windows(text)]
+    assert len(extractor.nlp.calls) == -(-len(windows) // 2)
+    assert tokens == sum(window.n_tokens for window in windows)
+    for i, text in enumerate(texts):
+        assert completed[i] == extractor.find_entities(text)
+
+
+REPORTS = [
+    ("1001", TEXT),
+    ("1002", ""),
+    ("1003", "Officer Delgado stopped the vehicle."),
+    ("1004", TEXT[:120]),
+    ("1005", TEXT + " " + TEXT),
+]
+
+
+@pytest.mark.parametrize("counts", [False, True])
+def test_batched_results_match_each_report(make_extractor, counts):
+    extractor = make_extractor(window_size=8, stride=3)
+    expected = {
+        report_number: extractor.extract_entities(text, counts)
+        for report_number, text in REPORTS
+    }
+
+    results = list(
+        extractor.extract_entities_batch(
+            iter(REPORTS), counts, batch_size=4, buffer_size=2
+        )
+    )
+    assert sorted(report_number for report_number, _ in results) == sorted(expected)
+    assert dict(results) == expected
+
+    assert extractor.stats["documents"] == len(REPORTS)
+    assert extractor.stats["tokens"] == sum(
+        window.n_tokens
+        for _, text in REPORTS
+        for window in extractor.get_windows(text)
+    )
+    assert extractor.stats["seconds"] > 0
+    assert extractor.stats["documents_per_second"] == pytest.approx(
+        extractor.stats["documents"] / extractor.stats["seconds"]
+    )
+    assert extractor.stats["tokens_per_second"] == pytest.approx(
+        extractor.stats["tokens"] / extractor.stats["seconds"]
+    )
+
+
+@pytest.mark.parametrize("counts", [False, True])
+def test_batched_dataframe_matches_each_report(make_extractor, counts):
+    extractor = make_extractor(window_size=8, stride=3)
+    expected = pd.concat(
+        [
+            extractor.create_dataframe(report_number, text, counts=True)
+            for report_number, text in REPORTS
+        ],
+        ignore_index=True,
+    )
+    if not counts:
+        expected = expected.drop(columns="count")
+
+    df = extractor.create_dataframe_batch(REPORTS, counts, buffer_size=2)
+    # Reports come out in the order they complete
+    df = df.sort_values("report_number", kind="stable", ignore_index=True)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert "Washington" in df["entity"].tolist()
+
+
+def test_batch_progress_is_printed(make_extractor, capsys):
+    extractor = make_extractor(window_size=8, stride=3)
+    list(extractor.extract_entities_batch(REPORTS, print_progress=True))
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[-1].startswith(f"{len(REPORTS)} documents, ")
+    assert lines[-1].endswith(" tokens/sec")
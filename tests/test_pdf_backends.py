@@ -0,0 +1,80 @@
+import pytest
+
+import pdf_backends
+
+# Text of every page of the test PDF, per backend
+PAGES = {
+    "first": ["A full first page of text", "", "x", "A full last page of text"],
+    "second": ["", "A second page found later", "", ""],
+    "third": ["", "", "A third page found at last", ""],
+}
+
+
+class FakeBackend(pdf_backends.Backend):
+    package = "fake"
+    calls = []
+
+    def iter_pages(self, pdf_file_path, page_numbers=None):
+        self.calls.append((self.name, page_numbers))
+        pages = PAGES[self.name]
+        if page_numbers is None:
+            page_numbers = range(len(pages))
+        for i in page_numbers:
+            yield pages[i]
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    backends = {}
+    for name in PAGES:
+        backends[name] = type(name, (FakeBackend,), {"name": name})
+    monkeypatch.setattr(pdf_backends, "BACKENDS", backends)
+    FakeBackend.calls.clear()
+    return pdf_backends.FallbackExtractor(list(PAGES))
+
+
+def test_weak_pages_are_retried_once_per_backend(extractor):
+    assert extractor.extract_pages("report.pdf") == [
+        "A full first page of text",
+        "A second page found later",
+        "A third page found at last",
+        "A full last page of text",
+    ]
+    assert FakeBackend.calls == [
+        ("first", None),
+        ("second", [1, 2]),
+        ("third", [2]),
+    ]
+
+
+def test_no_retry_when_every_page_is_full(extractor, monkeypatch):
+    monkeypatch.setitem(PAGES, "first", ["A full first page of text"])
+    assert extractor.extract_pages("report.pdf") == ["A full first page of text"]
+    assert FakeBackend.calls == [("first", None)]
+
+
+def test_weak_pages_are_retried_in_bounded_batches(extractor, monkeypatch):
+    monkeypatch.setattr(pdf_backends, "RETRY_BATCH", 2)
+    monkeypatch.setitem(PAGES, "first", ["", "", "", "A full last page of text"])
+    monkeypatch.setitem(PAGES, "second", ["A first page found later", "", "", ""])
+
+    assert extractor.extract_pages("report.pdf") == [
+        "A first page found later",
+        "",
+        "A third page found at last",
+        "A full last page of text",
+    ]
+    assert FakeBackend.calls == [
+        ("first", None),
+        ("second", [0, 1]),
+        ("third", [1]),
+        ("second", [2]),
+        ("third", [2]),
+    ]
+
+
+def test_full_pages_are_yielded_as_they_are_extracted(extractor):
+    pages = extractor.iter_pages("report.pdf")
+    assert next(pages) == "A full first page of text"
+    # Nothing was retried yet
+    assert FakeBackend.calls == [("first", None)]
@@ -0,0 +1,187 @@
+import pytest
+
+import search_index
+from search_index import SearchIndex, load_metadata, normalize_district
+from text_parser import TextParser
+
+CSV = """Log#,Incident Date & Time,District of Occurrence,COPA Notification Date
+2019-0000001,09/23/2019 10:15 am,6,09/23/2019
+2019-0000002,09/24/2019 10:15 am,06,09/24/2019
+2019-0000003,09/25/2019 10:15 am,6.0,09/25/2019
+2019-0000004,09/26/2019 10:15 am,16,09/26/2019
+2019-0000005,09/27/2019 10:15 am,Other,09/27/2019
+2019-0000006,09/28/2019 10:15 am,,09/28/2019
+"""
+
+
+class Parser:
+    def get_fingerprint(self, options):
+        return "test"
+
+
+def test_normalize_district():
+    assert normalize_district("6") == "06"
+    assert normalize_district("06") == "06"
+    assert normalize_district("6.0") == "06"
+    assert normalize_district("16") == "16"
+    assert normalize_district(" Other ") == "Other"
+    assert normalize_district(float("nan")) is None
+
+
+def test_district_filter_matches_every_spelling(tmp_path):
+    metadata_path = tmp_path / "copa_data.csv"
+    metadata_path.write_text(CSV)
+    metadata = load_metadata(metadata_path)
+
+    with SearchIndex(str(tmp_path / "search.sqlite"), Parser()) as index:
+        rows = [
+            (
+                doc_id,
+                log_number,
+                "hash",
+                10,
+                extra["district"],
+                extra["incident_date"],
+                extra["notification_date"],
+            )
+            for doc_id, (log_number, extra) in enumerate(metadata.items(), start=1)
+        ]
+        index.write_segment(1, {}, rows)
+        index.load_documents()
+
+        for district in ("6", "06", "6.0"):
+            assert index.filter_documents(district=district) == {1, 2, 3}
+        assert index.filter_documents(district="16") == {4}
+        assert index.filter_documents(district="Other") == {5}
+
+
+def test_old_indexes_are_normalized(tmp_path):
+    path = str(tmp_path / "search.sqlite")
+    with SearchIndex(path, Parser()) as index:
+        rows = [
+            (1, "2019-0000001", "hash", 10, "6", None, None),
+            (2, "2019-0000002", "hash", 10, "6.0", None, None),
+        ]
+        index.write_segment(1, {}, rows)
+
+    with SearchIndex(path, Parser()) as index:
+        assert index.filter_documents(district="06") == {1, 2}
+
+
+REPORTS = {
+    "2019-0000001": "The officer used excessive force and excessive language.",
+    "2019-0000002": "The complainant said the force used was excessive.",
+    "2019-0000003": "Excessive force. Excessive force. A taser was used.",
+    "2019-0000004": "The officer searched the vehicle without a warrant.",
+}
+
+METADATA = {
+    "2019-0000001": {"district": "06", "incident_date": "2019-01-10"},
+    "2019-0000002": {"district": "06", "incident_date": "2019-06-10"},
+    "2019-0000003": {"district": "16", "incident_date": "2020-01-10"},
+    "2019-0000004": {"district": "16", "incident_date": "2020-06-10"},
+}
+
+
+@pytest.fixture
+def text_folder(tmp_path):
+    folder = tmp_path / "text_files"
+    folder.mkdir()
+    for log_number, text in REPORTS.items():
+        (folder / f"{log_number}.txt").write_text(text, encoding="utf-8")
+    return folder
+
+
+@pytest.fixture
+def index(text_folder, tmp_path):
+    parser = TextParser(str(text_folder), "topic modeling")
+    # One segment per report, so every term has several segments
+    with SearchIndex(str(tmp_path / "search.sqlite"), parser) as index:
+        assert index.add(metadata=METADATA, batch_size=1) == 4
+        yield index
+
+
+def log_numbers(results):
+    return [log_number for log_number, _ in results]
+
+
+def test_bm25_ranks_frequent_terms_in_short_reports_first(index):
+    results = index.search("excessive force")
+    assert log_numbers(results) == ["2019-0000003", "2019-0000001", "2019-0000002"]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_phrases_must_appear_in_order(index):
+    # "the force used was excessive" has both words, but not in a row
+    assert log_numbers(index.search('"excessive force"')) == [
+        "2019-0000003",
+        "2019-0000001",
+    ]
+    assert log_numbers(index.search('"excessive language"')) == ["2019-0000001"]
+    assert index.search('"language excessive"') == []
+    # Other words only rank the reports that have the phrase
+    assert log_numbers(index.search('"excessive force" taser')) == [
+        "2019-0000003",
+        "2019-0000001",
+    ]
+
+
+def test_date_filters(index):
+    assert log_numbers(index.search("officer", date_from="2020-01-01")) == [
+        "2019-0000004"
+    ]
+    assert log_numbers(
+        index.search("excessive", date_from="2019-02-01", date_to="2019-12-31")
+    ) == ["2019-0000002"]
+    assert set(log_numbers(index.search("excessive", district="6.0"))) == {
+        "2019-0000001",
+        "2019-0000002",
+    }
+
+
+def test_changed_report_replaces_its_postings(index, text_folder):
+    assert index.add() == 0
+
+    (text_folder / "2019-0000004.txt").write_text(
+        "The officer deployed a taser.", encoding="utf-8"
+    )
+    assert index.add() == 1
+    assert index.search("warrant") == []
+    assert "2019-0000004" in log_numbers(index.search("taser"))
+    assert len(index.documents) == 4
+
+
+def test_optimize_merges_segments_and_keeps_results(index, text_folder):
+    (text_folder / "2019-0000004.txt").write_text(
+        "The officer deployed a taser.", encoding="utf-8"
+    )
+    index.add()
+    before = [index.search(query) for query in ("excessive force", "taser", "officer")]
+
+    index.optimize()
+    segments = index.connection.execute(
+        "SELECT COUNT(*), MAX(segment) FROM postings GROUP BY term"
+    ).fetchall()
+    assert set(segments) == {(1, 0)}
+    assert index.connection.execute(
+        "SELECT COUNT(*) FROM documents WHERE deleted = 1"
+    ).fetchone() == (0,)
+
+    index.load_documents()
+    after = [index.search(query) for query in ("excessive force", "taser", "officer")]
+    assert after == before
+
+
+def test_query_terms_are_decoded_once(index, monkeypatch):
+    calls = []
+    decode = search_index.decode_postings
+    monkeypatch.setattr(
+        search_index, "decode_postings", lambda data: calls.append(1) or decode(data)
+    )
+
+    first = index.search("excessive force")
+    decoded = len(calls)
+    assert decoded > 0
+    assert index.search("excessive force") == first
+    assert len(calls) == decoded
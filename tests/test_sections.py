@@ -0,0 +1,97 @@
+import os
+
+import sections
+from sections import build_section_index, extract_sections, load_sections
+from text_parser import TextParser
+
+REPORT = (
+    "LOG# 2019-0003826\r\n"
+    "I. INVOLVED PARTIES\r\n"
+    "Involved Officer #1: Officer A.\r\r\n"
+    "II. ALLEGATIONS\r\n"
+    "It is alleged that Officer A used excessive force.\r\n"
+    "V. CONCLUSION\r"
+    "The allegation is sustained.\r\n"
+)
+
+
+def write_report(folder, text, log_number="2019-0003826"):
+    path = os.path.join(folder, f"{log_number}.txt")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    return path
+
+
+def test_offsets_match_read_text_with_windows_newlines(tmp_path):
+    text_folder = str(tmp_path / "text_files")
+    sections_folder = str(tmp_path / "sections")
+    os.makedirs(text_folder)
+    write_report(text_folder, REPORT)
+
+    assert build_section_index(text_folder, sections_folder) == 1
+    parser = TextParser(
+        text_folder, nlp_task="summarization", sections_folder=sections_folder
+    )
+    text = parser.read_text("2019-0003826.txt")
+    assert load_sections("2019-0003826", sections_folder, text) is not None
+
+    assert parser.read_sections("2019-0003826.txt", ["allegations"]) == (
+        "It is alleged that Officer A used excessive force."
+    )
+    assert parser.read_sections("2019-0003826.txt", ["conclusion"]) == (
+        "The allegation is sustained."
+    )
+
+
+def test_changed_report_with_old_mtime_is_resegmented(tmp_path):
+    text_folder = str(tmp_path / "text_files")
+    sections_folder = str(tmp_path / "sections")
+    os.makedirs(text_folder)
+    path = write_report(text_folder, REPORT)
+    build_section_index(text_folder, sections_folder)
+    assert build_section_index(text_folder, sections_folder) == 0
+
+    # A copied-in report keeps the old mtime of its source
+    stat = os.stat(path)
+    changed = REPORT.replace("excessive force", "a taser")
+    write_report(text_folder, changed)
+    os.utime(path, (stat.st_atime - 3600, stat.st_mtime - 3600))
+
+    # Until it is rebuilt, the stale index is ignored
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    assert load_sections("2019-0003826", sections_folder, text) is None
+
+    assert build_section_index(text_folder, sections_folder) == 1
+    sections = load_sections("2019-0003826", sections_folder, text)
+    assert extract_sections(text, ["allegations"], sections) == (
+        "It is alleged that Officer A used a taser."
+    )
+
+
+def test_reading_checks_the_index_without_hashing(tmp_path, monkeypatch):
+    text_folder = str(tmp_path / "text_files")
+    sections_folder = str(tmp_path / "sections")
+    os.makedirs(text_folder)
+    path = write_report(text_folder, REPORT)
+    build_section_index(text_folder, sections_folder)
+    parser = TextParser(
+        text_folder, nlp_task="summarization", sections_folder=sections_folder
+    )
+    text = parser.read_text("2019-0003826.txt")
+
+    def fail(text):
+        raise AssertionError("the text was hashed on read")
+
+    monkeypatch.setattr(sections, "hash_text", fail)
+    assert load_sections("2019-0003826", sections_folder, text, path) is not None
+
+    # A touched file doesn't match until the index is built again
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_sections("2019-0003826", sections_folder, text, path) is None
+    monkeypatch.undo()
+
+    # Its text didn't change, so it isn't segmented again
+    assert build_section_index(text_folder, sections_folder) == 0
+    assert load_sections("2019-0003826", sections_folder, text, path) is not None
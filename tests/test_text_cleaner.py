@@ -0,0 +1,70 @@
+import random
+
+import pytest
+from text_cleaner import TextCleaner, check_parity, reference_clean, required_literal
+
+ATOMS = ["a", "b", "c", "x", "log", r"\d", r"\s", ".", r"\.", "A", "{", "}"]
+QUANTIFIERS = ["", "", "*", "+", "?", "*?", "{2}", "{1,3}", "{,2}", "{2,}"]
+ALPHABET = "abcxlogAB12. {},\n"
+
+
+def random_pattern(rng):
+    pattern = ""
+    for _ in range(rng.randint(1, 5)):
+        atom = rng.choice(ATOMS)
+        quantifier = rng.choice(QUANTIFIERS)
+        # A quantifier on a brace would make "{{2}" ambiguous to read
+        pattern += atom if atom in "{}" else atom + quantifier
+    return pattern
+
+
+def random_text(rng):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60)))
+
+
+@pytest.mark.parametrize(
+    "pattern, literal",
+    [
+        ("ab{2}c", "a"),
+        (r"log\d{1,3}zz", "log"),
+        ("abc{,2}de", "ab"),
+        ("xy{2,}zw", "zw"),
+        ("a{b", "a{b"),
+        (r"appendix\s+.*", "appendix"),
+        ("(a|b)", None),
+    ],
+)
+def test_required_literal(pattern, literal):
+    assert required_literal(pattern) == literal
+
+
+def test_brace_quantifiers_are_not_skipped():
+    assert TextCleaner([], [r"ab{2}c"]).clean("xx abbc yy") == "xx  yy"
+    assert TextCleaner([], [r"log\d{1,3}zz"]).clean("a log12zz b") == "a  b"
+
+
+def test_parity_with_random_patterns():
+    rng = random.Random(0)
+    for _ in range(300):
+        patterns = [random_pattern(rng) for _ in range(rng.randint(1, 3))]
+        texts = [random_text(rng) for _ in range(10)]
+        mismatches, _, _ = check_parity(texts, ["\n", "§"], patterns)
+        assert not mismatches, (patterns, [texts[i] for i in mismatches])
+
+
+def test_parity_with_text_parser_patterns():
+    from text_parser import CHARS_TO_REMOVE, REGEX_PATTERNS
+
+    text = (
+        "LOG# 2019-0003826\nFINAL SUMMARY REPORT\nPage 1 of 12\n"
+        "I. INVOLVED PARTIES\nInvolved Officer #1: Officer A, star #1234.\n"
+        "§ II. ALLEGATIONS\nIt is alleged that on September 23, 2019...\n"
+        "APPENDIX A\nDigital evidence list"
+    )
+    cleaner = TextCleaner(CHARS_TO_REMOVE, REGEX_PATTERNS)
+    for lower_text in (True, False):
+        expected = reference_clean(
+            text, CHARS_TO_REMOVE, REGEX_PATTERNS, lower_text=lower_text
+        )
+        result = cleaner.clean(cleaner.remove_chars(text), lower_text=lower_text)
+        assert result == expected
@@ -0,0 +1,79 @@
+import os
+import signal
+import time
+
+import text_extractor
+
+
+def fake_worker(job):
+    log_number = os.path.basename(job["pdf_file_path"])[: -len(".pdf")]
+    if log_number == "stuck":
+        # Like a backend stuck in C code: the alarm never interrupts it, and
+        # the .txt file is half written
+        signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        with open(os.path.join(job["output_folder"], "stuck.txt.tmp"), "w") as f:
+            f.write("partial")
+        time.sleep(60)
+    return {
+        "log_number": log_number,
+        "error": "Broken PDF" if log_number == "broken" else None,
+        "content_hash": None,
+        "from_cache": False,
+        "text": None,
+    }
+
+
+def make_job(folder, name, timeout=1):
+    return {
+        "pdf_file_path": os.path.join(folder, f"{name}.pdf"),
+        "timeout": timeout,
+        "content_hash": None,
+        "output_folder": folder,
+        "offsets_folder": folder,
+        "cache_path": None,
+    }
+
+
+def test_stuck_pdf_is_reported_and_the_run_goes_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_extractor, "extract_worker", fake_worker)
+    monkeypatch.setattr(text_extractor, "TIMEOUT_GRACE", 0.5)
+    names = ["first", "stuck", "third", "fourth"]
+    jobs = [make_job(str(tmp_path), name) for name in names]
+
+    start = time.monotonic()
+    results = list(text_extractor.run_jobs(jobs, workers=2))
+
+    assert time.monotonic() - start < 20
+    assert [result["log_number"] for result in results] == names
+    assert [result["error"] for result in results] == [
+        None,
+        "Timed out after 1 seconds",
+        None,
+        None,
+    ]
+    # The partial output of the killed worker is removed
+    assert os.listdir(tmp_path) == []
+
+
+def test_failures_of_a_previous_run_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_extractor, "extract_worker", fake_worker)
+    pdf_folder = tmp_path / "pdfs"
+    pdf_folder.mkdir()
+    failures_path = pdf_folder / "extraction_failures.csv"
+
+    def run():
+        text_extractor.process_all_pdfs(
+            str(pdf_folder),
+            str(tmp_path / "text"),
+            str(tmp_path / "offsets"),
+            timeout=0,
+        )
+
+    (pdf_folder / "broken.pdf").write_bytes(b"")
+    (pdf_folder / "report.pdf").write_bytes(b"")
+    run()
+    assert failures_path.read_text().splitlines() == ["Log#,Error", "broken,Broken PDF"]
+
+    (pdf_folder / "broken.pdf").unlink()
+    run()
+    assert not failures_path.exists()
@@ -0,0 +1,36 @@
+from dtm_builder import build_dtm
+from text_parser import TextParser
+
+
+def test_preprocess_removes_every_stop_group(tmp_path):
+    parser = TextParser(
+        str(tmp_path),
+        "topic modeling",
+        add_custom_stops=True,
+        findings_are_stops=True,
+        names_are_stops=True,
+    )
+    name = next(iter(parser.NAME_STOPS))
+    text = f"The officer said {name} was unfounded near the vehicle"
+
+    words = parser.preprocess(text, stem=False, lemmatize=False)
+    assert words == ["near", "vehicle"]
+
+
+def test_preprocess_normalizes_after_filtering(tmp_path):
+    parser = TextParser(str(tmp_path), "topic modeling")
+    assert parser.preprocess("The officers were running") == ["offic", "run"]
+
+
+def test_workers_give_the_serial_results(tmp_path):
+    for i, text in enumerate(["Officers were running", "A vehicle", "The car"] * 3):
+        (tmp_path / f"2019-000{i}.txt").write_text(text, encoding="utf-8")
+    parser = TextParser(str(tmp_path), "topic modeling")
+
+    serial = parser.get_full_corpus(stem_input=True)
+    assert parser.get_full_corpus(stem_input=True, workers=2, chunk_size=2) == serial
+
+    matrix, vocabulary, log_numbers = build_dtm(parser, stem_input=True)
+    parallel = build_dtm(parser, stem_input=True, workers=2, chunk_size=2)
+    assert (parallel[0] != matrix).nnz == 0
+    assert parallel[1:] == (vocabulary, log_numbers)